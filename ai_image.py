@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import aiohttp
+from cache import LRUCache
+from llm import chat_completion
+from backend import get_session
+from images import ImageFetchError, fetch_image
+from image_payload import Base64JSONPayload, parse_data_url, raw_image_form
+from config import (
+    FRIDAYY_BASE_URL,
+    AI_IMAGE_MODEL,
+    AI_IMAGE_UPLOAD_MULTIPART,
+    AI_IMAGE_CACHE_TTL,
+    AI_IMAGE_CACHE_MAX_BYTES,
+)
+
+DEFAULT_PROMPT = "Product in the photo is {product_name}. Create a background for it showing it being used."
+
+
+class AIImageError(Exception):
+    """Generation or upload failed, `retry` says whether trying again can help."""
+
+    def __init__(self, message: str, retry: bool = True):
+        super().__init__(message)
+        self.retry = retry
+
+
+# -------------------------
+# UPLOAD SINKS
+# -------------------------
+
+class UploadSink:
+    """Where a generated image is uploaded: a Fridayy endpoint, extra fields and the response key holding its URL."""
+
+    def __init__(self, path: str, url_key: str, fields: dict | None = None):
+        self.path = path
+        self.url_key = url_key
+        self.fields = fields or {}
+
+    async def upload(self, auth_token, media_type: str, base64_body: memoryview) -> str:
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        if AI_IMAGE_UPLOAD_MULTIPART:
+            body = raw_image_form(self.fields, "image", base64_body, media_type)
+        else:
+            body = Base64JSONPayload(self.fields, "base64_image", base64_body)
+        session = get_session()
+        async with session.post(f"{FRIDAYY_BASE_URL}{self.path}", data=body, headers=headers) as response:
+            try:
+                data = await response.json()
+            except Exception:
+                raise AIImageError("Failed to upload AI image.")
+        if response.status == 401 or (isinstance(data, dict) and data.get("code") == "token_not_valid"):
+            raise AIImageError("Authentication failed. Please re-authenticate.", retry=False)
+        uploaded_image_url = data.get(self.url_key) if isinstance(data, dict) else None
+        if not uploaded_image_url:
+            raise AIImageError("No image URL returned from the server after upload.")
+        return uploaded_image_url
+
+
+def s3_sink() -> UploadSink:
+    """Only host the image, for images sent to the seller."""
+    return UploadSink("/bot/upload_image_to_s3/", "image_url")
+
+
+def product_sink(product_id, store_id) -> UploadSink:
+    """Save the image to a product."""
+    return UploadSink(
+        "/bot/upload_ai_image/",
+        "ai_image_url",
+        {"product_id": product_id, "store_id": store_id, "generation_type": "ai"},
+    )
+
+
+# -------------------------
+# ENGINE
+# -------------------------
+
+class AIImageEngine:
+    """
+    Generates AI product images once per (source image, product name, prompt, model).
+
+    Generated images are kept in a content-addressed cache keyed by the hash of the
+    source image bytes, so a repeated request or a retried upload doesn't run the image
+    model again, and identical requests arriving together share one generation.
+    """
+
+    def __init__(self, model: str, cache_ttl: float, cache_max_bytes: int):
+        self.model = model
+        self._cache = LRUCache(
+            max_entries=10_000,
+            ttl=cache_ttl,
+            max_bytes=cache_max_bytes,
+            sizeof=lambda image: len(image[1]),
+        )
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.generations = 0
+        self.shared = 0
+
+    async def _cache_key(self, image_url: str, product_name: str, prompt: str) -> str:
+        try:
+            source = hashlib.sha256(await fetch_image(image_url)).hexdigest()
+        except (ImageFetchError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # The model may still reach the image, fall back to keying on its URL
+            print(f"Failed to download image for hashing from {image_url}: {e}")
+            source = "url:" + image_url
+        return hashlib.sha256("\0".join((source, product_name, prompt, self.model)).encode()).hexdigest()
+
+    async def generate(self, image_url: str, product_name: str, prompt: str = DEFAULT_PROMPT) -> tuple[str, memoryview]:
+        """Media type and base64 body of the generated image."""
+        prompt = prompt.format(product_name=product_name)
+        key = await self._cache_key(image_url, product_name, prompt)
+        image = self._cache.get(key)
+        if image is not None:
+            return image
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._generate(image_url, prompt))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        image = await asyncio.shield(task)
+        self._cache.set(key, image)
+        return image
+
+    async def _generate(self, image_url: str, prompt: str) -> tuple[str, memoryview]:
+        self.generations += 1
+        completion = await chat_completion(
+            model=self.model,
+            modalities=["image", "text"],
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"{image_url}"
+                            }
+                        }
+                    ]
+                }
+            ]
+        )
+        try:
+            data_url = completion.choices[0].message.images[0].get("image_url", {}).get("url")
+        except (AttributeError, IndexError, TypeError):
+            data_url = None
+        if not data_url:
+            raise AIImageError("AI image generation failed: No image returned.")
+        try:
+            # Keeps the base64 body as a memoryview, not another string
+            return parse_data_url(data_url)
+        except ValueError:
+            raise AIImageError("AI image generation returned an invalid data URL.")
+
+    async def create(self, auth_token, product_name: str, image_url: str, sink: UploadSink) -> str:
+        """Generate (or reuse) the image and upload it to `sink`, returns the uploaded image URL."""
+        media_type, base64_body = await self.generate(image_url, product_name)
+        return await sink.upload(auth_token, media_type, base64_body)
+
+    def stats(self) -> dict:
+        return {"generations": self.generations, "shared": self.shared, **self._cache.stats()}
+
+
+ai_images = AIImageEngine(AI_IMAGE_MODEL, AI_IMAGE_CACHE_TTL, AI_IMAGE_CACHE_MAX_BYTES)
+
+
+async def generate_ai_image_url(auth_token, product_name, image_url, product_id=None, store_id=None) -> str:
+    """
+    Generate a product photo with a background showing it in use, upload it and return its URL.
+
+    With product_id and store_id the image is saved to that product, otherwise it is only hosted.
+    """
+    sink = product_sink(product_id, store_id) if product_id is not None else s3_sink()
+    return await ai_images.create(auth_token, product_name, image_url, sink)
@@ -0,0 +1,52 @@
+import asyncio
+import traceback
+
+# Telegram albums hold at most 10 items
+MAX_ALBUM_SIZE = 10
+
+
+def best_photo_size(photo_sizes):
+    """Highest resolution PhotoSize, file_size is optional in the Bot API."""
+    return max(photo_sizes, key=lambda p: (p.width * p.height, p.file_size or 0))
+
+
+class AlbumAggregator:
+    """
+    Buffers the photos of a Telegram album (updates sharing a media_group_id) and hands
+    them over together once no new photo arrived for `window` seconds.
+    `on_album(items)` receives the buffered (update, context) pairs in arrival order.
+    """
+
+    def __init__(self, on_album, window: float):
+        self.on_album = on_album
+        self.window = window
+        self._albums: dict[str, list] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, media_group_id: str, update, context):
+        items = self._albums.setdefault(media_group_id, [])
+        items.append((update, context))
+        timer = self._timers.pop(media_group_id, None)
+        if timer:
+            timer.cancel()
+        if len(items) >= MAX_ALBUM_SIZE:
+            self._flush(media_group_id)
+        else:
+            loop = asyncio.get_running_loop()
+            self._timers[media_group_id] = loop.call_later(self.window, self._flush, media_group_id)
+
+    def _flush(self, media_group_id: str):
+        self._timers.pop(media_group_id, None)
+        items = self._albums.pop(media_group_id, None)
+        if not items:
+            return
+        task = asyncio.create_task(self._deliver(media_group_id, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, media_group_id: str, items):
+        try:
+            await self.on_album(items)
+        except Exception as e:
+            print(f"Error handling album {media_group_id}: {e}\n{traceback.format_exc()}")
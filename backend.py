@@ -0,0 +1,70 @@
+import contextvars
+from contextlib import contextmanager
+import aiohttp
+from config import (
+    FRIDAYY_BASE_URL,
+    BACKEND_POOL_SIZE,
+    BACKEND_POOL_PER_HOST,
+    BACKEND_KEEPALIVE_TIMEOUT,
+    BACKEND_DNS_CACHE_TTL,
+)
+
+# (URL, status) of the backend requests made during the current watch_requests block
+_requests: contextvars.ContextVar[list | None] = contextvars.ContextVar("backend_requests", default=None)
+
+
+async def _on_request_end(session, context, params):
+    if str(params.url).startswith(FRIDAYY_BASE_URL):
+        seen = _requests.get()
+        if seen is not None:
+            seen.append((str(params.url), params.response.status))
+
+
+@contextmanager
+def watch_requests():
+    """Collect (URL, status) of the backend requests made inside the block (and tasks it starts), in order."""
+    seen = []
+    token = _requests.set(seen)
+    try:
+        yield seen
+    finally:
+        _requests.reset(token)
+
+
+class BackendClient:
+    """
+    Owns the long-lived aiohttp session shared by all Fridayy backend calls (and the
+    Telegram file downloads that feed them), so connections and TLS sessions are reused.
+    """
+
+    def __init__(self):
+        self._session: aiohttp.ClientSession | None = None
+
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily so tools also work outside the bot (scripts, one-off calls)
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=BACKEND_POOL_SIZE,
+                limit_per_host=BACKEND_POOL_PER_HOST,
+                keepalive_timeout=BACKEND_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=BACKEND_DNS_CACHE_TTL,
+            )
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_end.append(_on_request_end)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        return self._session
+
+    async def start(self):
+        self.session()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+backend = BackendClient()
+
+
+def get_session() -> aiohttp.ClientSession:
+    return backend.session()
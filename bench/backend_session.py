@@ -0,0 +1,86 @@
+"""
+Benchmark of backend call latency: a new aiohttp ClientSession per call against the
+shared pooled session from backend.py.
+
+Runs get_all_products against an in-process stub of the backend over plain HTTP, or
+over TLS with --cert/--key (a self-signed pair for "localhost" the client trusts through
+SSL_CERT_FILE):
+
+    python -m bench.backend_session
+    SSL_CERT_FILE=cert.pem python -m bench.backend_session --cert cert.pem --key key.pem
+"""
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import sys
+import time
+
+_PORT = 18081
+# tools reads the backend URL at import
+os.environ["FRIDAYY_BASE_URL"] = f"https://localhost:{_PORT}" if "--cert" in sys.argv else f"http://127.0.0.1:{_PORT}"
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+import tools  # noqa: E402
+from backend import backend  # noqa: E402
+from tool_cache import _responses  # noqa: E402
+
+
+async def _products(request):
+    return web.json_response([{"id": i, "product_name": f"Product {i}", "mrp": 100 + i} for i in range(40)])
+
+
+async def _new_session_per_call(store_id, auth_token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            f"{tools.base_url}/ocr/get_all_products/",
+            params={"store_id": store_id},
+            headers={"Authorization": f"Bearer {auth_token}"},
+        ) as response:
+            return await response.json()
+
+
+async def _shared_session(store_id, auth_token):
+    _responses.clear()  # time the request, not the tool cache
+    return await tools.get_all_products(store_id, auth_token)
+
+
+async def _bench(label, call, calls):
+    latencies = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        await call("1", "bench")
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(f"{label:28s} p50 {statistics.median(latencies):6.2f} ms  p95 {latencies[int(calls * 0.95)]:6.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="calls per variant")
+    parser.add_argument("--cert", help="certificate for a TLS stub")
+    parser.add_argument("--key", help="private key for a TLS stub")
+    args = parser.parse_args()
+
+    ssl_context = None
+    if args.cert:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.cert, args.key)
+    app = web.Application()
+    app.router.add_get("/ocr/get_all_products/", _products)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", _PORT, ssl_context=ssl_context).start()
+
+    await _bench("new ClientSession per call", _new_session_per_call, args.calls)
+    await _bench("shared pooled session", _shared_session, args.calls)
+    await backend.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
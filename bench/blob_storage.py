@@ -0,0 +1,113 @@
+"""
+Benchmark of blob storage for large message contents (needs aiosqlite).
+
+Fills a throwaway SQLite database with chats whose tool results repeat large product
+lists and store stories, stored inline, then moves them to blobs with migrate_blobs and
+reports the database size and cold history load times before and after:
+
+    python -m bench.blob_storage --chats 200 --min-chars 8192
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+_DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_PATH}"
+os.environ["BLOB_MIN_CHARS"] = "0"  # write the inline layout first
+
+import config  # noqa: E402
+import migrate_blobs  # noqa: E402
+import models  # noqa: E402
+
+_TURNS = 30
+
+
+def _catalog(products: int, chat: int) -> str:
+    return json.dumps([{
+        "id": 20000 + i,
+        "product_name": f"Blue pottery vase {i}",
+        "mrp": 400 + i,
+        "is_visible_in_storefront": True,
+        "short_description": "Hand thrown ceramic vase " * 8,
+        "images": [f"https://cdn.fridayy.ai/p/{chat}/{i}/{k}.jpg" for k in range(3)],
+    } for i in range(products)])
+
+
+async def _fill(chats: int):
+    await models.init_db()
+    for chat in range(chats):
+        products = _catalog(random.randint(10, 60), chat)
+        story = json.dumps({"profile_response": {"about": f"Store {chat} story. " * 150}})
+        rows = []
+        for turn in range(_TURNS):
+            rows.append({"role": "user", "content": f"message {turn} from seller {chat}"})
+            if turn % 3 == 0:
+                rows.append({"role": "assistant", "content": "{}", "name": "get_all_products", "tool_call_id": f"c{turn}"})
+                rows.append({"role": "tool", "content": products, "name": "get_all_products", "tool_call_id": f"c{turn}"})
+            if turn == 10:
+                rows.append({"role": "tool", "content": story, "name": "capture_store_story", "tool_call_id": "s"})
+            rows.append({"role": "assistant", "content": "Which product would you like to update? " * 3})
+        await models.save_messages_orm(str(chat), rows)
+
+
+async def _load_all(chats: int) -> tuple[float, float]:
+    """Seconds to load every chat's full history, then every chat's recent window, from cold caches."""
+    models.transcript_cache.clear()
+    models._blob_texts.clear()
+    started = time.perf_counter()
+    for chat in range(chats):
+        await models.get_conversation_messages_orm(str(chat))
+    full = time.perf_counter() - started
+    models.transcript_cache.clear()
+    models._blob_texts.clear()
+    started = time.perf_counter()
+    for chat in range(chats):
+        await models.get_recent_messages_orm(str(chat))
+    return full, time.perf_counter() - started
+
+
+def _size() -> int:
+    connection = sqlite3.connect(_DB_PATH)
+    connection.execute("VACUUM")
+    connection.close()
+    return os.path.getsize(_DB_PATH)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200, help="chats to fill, 30 turns each")
+    parser.add_argument("--min-chars", type=int, default=8192, help="BLOB_MIN_CHARS for the migration")
+    args = parser.parse_args()
+    random.seed(1)
+
+    await _fill(args.chats)
+    size_before = _size()
+    full_before, recent_before = await _load_all(args.chats)
+    inline = [m.content for m in await models.get_conversation_messages_orm("1")]
+
+    config.BLOB_MIN_CHARS = args.min_chars
+    started = time.perf_counter()
+    await migrate_blobs.migrate_blobs()
+    migration = time.perf_counter() - started
+    size_after = _size()
+    full_after, recent_after = await _load_all(args.chats)
+    assert [m.content for m in await models.get_conversation_messages_orm("1")] == inline, "contents changed"
+
+    connection = sqlite3.connect(_DB_PATH)
+    blobs, = connection.execute("SELECT count(*) FROM blobs").fetchone()
+    refs, = connection.execute("SELECT count(*) FROM messages WHERE blob_hash IS NOT NULL").fetchone()
+    connection.close()
+    print(f"{args.chats} chats, {refs} messages moved to {blobs} blobs in {migration:.2f} s")
+    print(f"DB size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+    print(f"full history, cold: {full_before * 1000:.0f} ms -> {full_after * 1000:.0f} ms")
+    print(f"recent window, cold: {recent_before * 1000:.0f} ms -> {recent_after * 1000:.0f} ms")
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
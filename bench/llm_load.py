@@ -0,0 +1,82 @@
+"""
+Load test for the chat loop's LLM client: many chats calling chat_completion at once.
+
+Runs against an in-process fake of the OpenRouter chat completions endpoint that answers
+after `--latency` seconds, and reports completed requests per second and the most
+requests the fake saw in flight at once, for each number of concurrent chats:
+
+    python -m bench.llm_load --max-concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import time
+
+_PORT = 18080
+# The LLM clients are built at import, point them at the fake first
+os.environ.update(
+    OPENROUTER_BASE_URL=f"http://127.0.0.1:{_PORT}/v1",
+    OPENROUTER_API_KEY="bench",
+    LLM_RATE_LIMIT_RPM="0",
+)
+
+
+class FakeOpenRouter:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.peak = 0
+
+    async def completions(self, request):
+        from aiohttp import web
+        body = await request.json()
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return web.json_response({
+            "id": "bench", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        })
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.completions)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", _PORT).start()
+        return runner
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-concurrency", default="64", help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the fake takes per request")
+    parser.add_argument("--chats", default="1,10,50,200", help="comma separated numbers of concurrent chats")
+    parser.add_argument("--turns", type=int, default=5, help="requests each chat makes, one after another")
+    args = parser.parse_args()
+    os.environ["LLM_MAX_CONCURRENCY"] = args.max_concurrency
+    from llm import chat_completion
+
+    fake = FakeOpenRouter(args.latency)
+    runner = await fake.start()
+
+    async def chat():
+        for _ in range(args.turns):
+            await chat_completion(model="bench", messages=[{"role": "user", "content": "hi"}])
+
+    for chats in map(int, args.chats.split(",")):
+        fake.peak = 0
+        started = time.perf_counter()
+        await asyncio.gather(*(chat() for _ in range(chats)))
+        elapsed = time.perf_counter() - started
+        print(f"{chats:4d} concurrent chats: {chats * args.turns / elapsed:7.1f} requests/s, peak in flight {fake.peak}")
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
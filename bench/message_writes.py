@@ -0,0 +1,69 @@
+"""
+Benchmark of message persistence: rows/s for per-row saves, per-turn batches and the
+write-behind MessageWriter, with many chats saving their turns at once.
+
+Uses DATABASE_URL when set, otherwise a throwaway SQLite file (needs aiosqlite):
+
+    python -m bench.message_writes --chats 100 --turns 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db"
+
+import models  # noqa: E402
+from models import MessageWriter, init_db, save_message_orm, save_messages_orm  # noqa: E402
+
+# Each turn saves a user message and two tool calls with their results
+_TOOL_ROUNDS = 2
+_ROWS_PER_TURN = 1 + 2 * _TOOL_ROUNDS
+
+
+async def _per_row(chat_id, turns):
+    for _ in range(turns):
+        await save_message_orm(chat_id, "user", "hello")
+        for _ in range(_TOOL_ROUNDS):
+            await save_message_orm(chat_id, "assistant", "{}", name="get_all_products", tool_call_id="call")
+            await save_message_orm(chat_id, "tool", "{}" * 100, name="get_all_products", tool_call_id="call")
+
+
+async def _per_turn(chat_id, turns):
+    for _ in range(turns):
+        await save_message_orm(chat_id, "user", "hello")
+        await save_messages_orm(chat_id, [
+            {"role": "assistant", "content": "{}", "name": "get_all_products", "tool_call_id": "call"},
+            {"role": "tool", "content": "{}" * 100, "name": "get_all_products", "tool_call_id": "call"},
+        ] * _TOOL_ROUNDS)
+
+
+async def _run(label, save, chats, turns):
+    started = time.perf_counter()
+    await asyncio.gather(*(save(f"bench-{label}-{i}", turns) for i in range(chats)))
+    if models.message_writer.running:
+        await models.message_writer.close()
+    elapsed = time.perf_counter() - started
+    print(f"{label:36s} {chats * turns * _ROWS_PER_TURN / elapsed:8.0f} rows/s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=100, help="chats saving at once")
+    parser.add_argument("--turns", type=int, default=5, help="turns each chat saves")
+    args = parser.parse_args()
+
+    await init_db()
+    await _run("per-row save_message_orm", _per_row, args.chats, args.turns)
+    await _run("per-turn batch", _per_turn, args.chats, args.turns)
+    for durable in (True, False):
+        models.message_writer = MessageWriter(0.005, 500, durable=durable)
+        models.message_writer.start()
+        await _run(f"write-behind queue, durable={durable}", _per_turn, args.chats, args.turns)
+    await models.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
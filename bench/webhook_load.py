@@ -0,0 +1,123 @@
+"""
+Load generator for the Telegram webhook route.
+
+Posts synthetic text-message Updates as fast as `--concurrency` senders can and reports
+accepted updates per second and request latency percentiles.
+
+Against a running bot (webhook mode, same WEBHOOK_SECRET):
+    python -m bench.webhook_load --url http://localhost:8080/telegram --secret $WEBHOOK_SECRET
+
+Without --url it starts a WebhookIngress in-process whose handlers only sleep
+`--handler-ms`, which measures the ingress and queue on their own.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import aiohttp
+from aiohttp import web
+from webhook import SECRET_HEADER, WebhookIngress
+
+LOCAL_PORT = 18085
+
+
+def make_update(update_id: int, chats: int) -> dict:
+    chat_id = random.randint(1, chats)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": f"load test message {update_id}",
+        },
+    }
+
+
+class _SleepingApp:
+    """Stands in for the bot application, each update takes `seconds` to handle."""
+
+    def __init__(self, seconds: float):
+        from telegram import Bot
+        self.bot = Bot("123:load")
+        self.seconds = seconds
+        self.processed = 0
+
+    async def process_update(self, update):
+        await asyncio.sleep(self.seconds)
+        self.processed += 1
+
+
+async def _start_local(secret: str, handler_seconds: float, queue_size: int, workers: int):
+    from health import create_health_app
+    app = _SleepingApp(handler_seconds)
+    ingress = WebhookIngress(app, secret, queue_size, workers)
+    health_app = create_health_app()
+    health_app.router.add_post("/telegram", ingress.handle)
+    runner = web.AppRunner(health_app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", LOCAL_PORT).start()
+    ingress.start()
+    return f"http://127.0.0.1:{LOCAL_PORT}/telegram", ingress, runner, app
+
+
+async def run(url: str, secret: str, count: int, concurrency: int, chats: int) -> dict:
+    latencies = []
+    codes = {}
+    pending = iter(range(1, count + 1))
+    headers = {SECRET_HEADER: secret, "Content-Type": "application/json"}
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def sender():
+            for update_id in pending:
+                body = json.dumps(make_update(update_id, chats)).encode()
+                started = time.perf_counter()
+                async with session.post(url, data=body, headers=headers) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - started)
+                codes[response.status] = codes.get(response.status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "updates": count,
+        "accepted_per_second": codes.get(200, 0) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "status_codes": codes,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="webhook URL of a running bot, default: an in-process ingress")
+    parser.add_argument("--secret", default="load-test-secret", help="WEBHOOK_SECRET of the bot")
+    parser.add_argument("--count", type=int, default=5000, help="updates to send")
+    parser.add_argument("--concurrency", type=int, default=64, help="requests in flight")
+    parser.add_argument("--chats", type=int, default=500, help="distinct chat ids to spread updates over")
+    parser.add_argument("--handler-ms", type=float, default=5, help="in-process only: time each update takes")
+    parser.add_argument("--queue-size", type=int, default=1000, help="in-process only: WEBHOOK_QUEUE_SIZE")
+    parser.add_argument("--workers", type=int, default=16, help="in-process only: WEBHOOK_WORKERS")
+    args = parser.parse_args()
+
+    local = None
+    url = args.url
+    if url is None:
+        local = await _start_local(args.secret, args.handler_ms / 1000, args.queue_size, args.workers)
+        url = local[0]
+    result = await run(url, args.secret, args.count, args.concurrency, args.chats)
+    print(f"{result['updates']} updates, {args.concurrency} concurrent senders: "
+          f"{result['accepted_per_second']:.0f} updates/s accepted, "
+          f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, status codes {result['status_codes']}")
+    if local is not None:
+        _, ingress, runner, app = local
+        await ingress.close()
+        await runner.cleanup()
+        print(f"Handled {app.processed} updates in-process")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
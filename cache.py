@@ -0,0 +1,122 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    In-process LRU cache with an optional TTL and memory budget.
+
+    With `idle_ttl=True` an entry's TTL restarts on every hit, so it only expires
+    after sitting unused; otherwise it expires a fixed time after it was stored.
+    `sizeof(value)` estimates an entry's size in bytes for `max_bytes`.
+    """
+
+    def __init__(self, max_entries: int, ttl: float | None = None, max_bytes: int | None = None,
+                 sizeof=None, idle_ttl: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.idle_ttl = idle_ttl
+        self._data: OrderedDict = OrderedDict()  # key -> [value, expires_at, size]
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry) -> bool:
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+    def _expires_at(self):
+        return time.monotonic() + self.ttl if self.ttl else None
+
+    def _remove(self, key):
+        entry = self._data.pop(key)
+        self.bytes -= entry[2]
+        return entry
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry):
+            if entry is not None:
+                self._remove(key)
+                self.evictions += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        if self.idle_ttl:
+            entry[1] = self._expires_at()
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """Like get, without touching LRU order or the counters."""
+        entry = self._data.get(key)
+        if entry is None or self._expired(entry):
+            return default
+        return entry[0]
+
+    def set(self, key, value):
+        if key in self._data:
+            self._remove(key)
+        size = self.sizeof(value)
+        self._data[key] = [value, self._expires_at(), size]
+        self.bytes += size
+        self._evict()
+
+    def resize(self, key):
+        """Recompute an entry's size after its value was changed in place."""
+        entry = self._data.get(key)
+        if entry is None:
+            return
+        size = self.sizeof(entry[0])
+        self.bytes += size - entry[2]
+        entry[2] = size
+        self._evict()
+
+    def pop(self, key, default=None):
+        if key not in self._data:
+            return default
+        return self._remove(key)[0]
+
+    def discard_where(self, predicate) -> int:
+        """Drop every entry whose key matches `predicate`, returns how many were dropped."""
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def _evict(self):
+        # Expired entries at the cold end first, then least recently used until within budget.
+        # Other expired entries are dropped lazily when looked up.
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            over_budget = len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            )
+            if not over_budget and not self._expired(entry):
+                break
+            self._remove(key)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
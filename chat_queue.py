@@ -0,0 +1,94 @@
+import asyncio
+import traceback
+
+
+class ChatScheduler:
+    """
+    Runs the work for each chat strictly in order, with one worker per active chat.
+
+    Messages that arrive while a chat's turn is running are coalesced into a single call
+    of `handler(update, content)`, which replies to the newest update. Once a burst is
+    under way (more than one message waiting), further messages within `debounce` seconds
+    of each other join it too; a lone message is handled right away. A worker exits after `idle_timeout` seconds
+    without messages, so memory is bounded by the number of active chats.
+
+    `content` is the message text, or an async function returning it for messages that
+    need a lookup first (a photo's file URL). Those are resolved by the chat's worker, so
+    a message is queued in the order it arrived, not the order its lookup finished.
+    """
+
+    def __init__(self, handler, debounce: float, idle_timeout: float, max_batch: int = 10):
+        self.handler = handler
+        self.debounce = debounce
+        self.idle_timeout = idle_timeout
+        self.max_batch = max_batch
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._workers)
+
+    def submit(self, chat_id: str, update, content):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+            self._workers[chat_id] = asyncio.create_task(self._work(chat_id, queue))
+        queue.put_nowait((update, content))
+
+    async def _next_batch(self, queue: asyncio.Queue):
+        items = [await asyncio.wait_for(queue.get(), self.idle_timeout)]
+        # Take everything that piled up while the previous turn ran, and wait out the debounce
+        # window only during a burst, so a single message isn't held up
+        while len(items) < self.max_batch:
+            if not queue.empty():
+                items.append(queue.get_nowait())
+                continue
+            if not self.debounce or len(items) == 1:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), self.debounce))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _work(self, chat_id: str, queue: asyncio.Queue):
+        try:
+            while True:
+                try:
+                    items = await self._next_batch(queue)
+                except asyncio.TimeoutError:
+                    # No await between this check and the cleanup below, so no message can slip in
+                    if queue.empty():
+                        break
+                    continue
+                if len(items) > 1:
+                    print(f"Coalesced {len(items)} messages for chat {chat_id}")
+                update = items[-1][0]
+                try:
+                    contents = [await self._resolve(chat_id, content) for _, content in items]
+                    if not any(contents):
+                        continue
+                    await self.handler(update, "\n".join(content for content in contents if content))
+                except Exception as e:
+                    print(f"Error handling messages for chat {chat_id}: {e}\n{traceback.format_exc()}")
+        finally:
+            self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+
+    @staticmethod
+    async def _resolve(chat_id: str, content) -> str:
+        if isinstance(content, str):
+            return content
+        try:
+            return await content()
+        except Exception as e:
+            print(f"Dropping a message for chat {chat_id}, resolving it failed: {e}")
+            return ""
+
+    async def close(self):
+        """Cancel all chat workers."""
+        tasks = list(self._workers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
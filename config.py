@@ -16,6 +16,118 @@ def clean_env_var(value: str | None) -> str | None:
     return re.sub(r"^['\"](.*)['\"]$", r"\1", value)
 
 OPENROUTER_API_KEY = clean_env_var(os.getenv("OPENROUTER_API_KEY"))
+OPENROUTER_BASE_URL = clean_env_var(os.getenv("OPENROUTER_BASE_URL")) or "https://openrouter.ai/api/v1"
 BOT_TOKEN = clean_env_var(os.getenv("BOT_TOKEN"))
 MODEL = clean_env_var(os.getenv("MODEL"))  # e.g. gemini/..., anthropic/...
 DATABASE_URL = clean_env_var(os.getenv("DATABASE_URL")) or "sqlite:///message_history.db"
+
+# LLM concurrency and rate limiting
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))  # max in-flight LLM requests per process
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "600"))  # per model, 0 disables the limiter
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "20"))
+
+# Conversation history window sent to the LLM
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "60"))
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "12000"))  # 0 disables the token budget
+
+# In-process cache of hot conversation transcripts
+TRANSCRIPT_CACHE_MAX_CHATS = int(os.getenv("TRANSCRIPT_CACHE_MAX_CHATS", "1000"))
+TRANSCRIPT_CACHE_IDLE_TTL = int(os.getenv("TRANSCRIPT_CACHE_IDLE_TTL", "1800"))  # seconds without activity
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Message contents this long (mostly tool results) are stored once per content hash, zlib-compressed,
+# in the blobs table; the message row only keeps a reference
+BLOB_MIN_CHARS = int(os.getenv("BLOB_MIN_CHARS", "8192"))  # 0 stores everything inline
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # decompressed blobs kept in memory
+
+# Rolling conversation summary, older turns are folded into it in the background
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "1") == "1"
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "40"))  # unsummarized messages before folding
+SUMMARY_KEEP_MESSAGES = int(os.getenv("SUMMARY_KEEP_MESSAGES", "12"))  # newest messages always kept verbatim
+SUMMARY_MODEL = clean_env_var(os.getenv("SUMMARY_MODEL")) or MODEL
+
+# Message persistence: "sync" waits for each batch to commit, "async" returns right away
+# and may lose up to MESSAGE_FLUSH_INTERVAL_MS of messages if the process dies
+MESSAGE_WRITE_MODE = os.getenv("MESSAGE_WRITE_MODE", "sync")
+MESSAGE_FLUSH_INTERVAL_MS = int(os.getenv("MESSAGE_FLUSH_INTERVAL_MS", "5"))
+MESSAGE_FLUSH_MAX_ROWS = int(os.getenv("MESSAGE_FLUSH_MAX_ROWS", "500"))
+
+# Fridayy backend and the shared HTTP connection pool used to reach it
+FRIDAYY_BASE_URL = clean_env_var(os.getenv("FRIDAYY_BASE_URL")) or "https://dev.fridayy.ai"
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "100"))  # max open connections, 0 is unlimited
+BACKEND_POOL_PER_HOST = int(os.getenv("BACKEND_POOL_PER_HOST", "50"))
+BACKEND_KEEPALIVE_TIMEOUT = float(os.getenv("BACKEND_KEEPALIVE_TIMEOUT", "60"))  # seconds an idle connection is kept
+BACKEND_DNS_CACHE_TTL = int(os.getenv("BACKEND_DNS_CACHE_TTL", "300"))
+
+# Telegram image downloads feeding product and store uploads
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "16"))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "30"))  # seconds per image
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+# Stream each download straight into the upload body (chunked request) instead of buffering whole files
+IMAGE_UPLOAD_STREAMING = os.getenv("IMAGE_UPLOAD_STREAMING", "0") == "1"
+
+# Max tool calls from one LLM turn running at the same time
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "4"))
+
+# Per-chat message queue: messages sent while a turn runs become one LLM turn, and a burst
+# keeps collecting until no message arrived for the debounce window (a lone message never waits)
+CHAT_DEBOUNCE_MS = int(os.getenv("CHAT_DEBOUNCE_MS", "500"))
+CHAT_IDLE_TIMEOUT = float(os.getenv("CHAT_IDLE_TIMEOUT", "300"))  # seconds before an idle chat worker exits
+
+# Photos of one Telegram album are collected until none arrived for this long
+ALBUM_WINDOW_MS = int(os.getenv("ALBUM_WINDOW_MS", "1000"))
+
+# Webhook mode: set WEBHOOK_URL (public URL Telegram posts to) to use it instead of long polling
+WEBHOOK_URL = clean_env_var(os.getenv("WEBHOOK_URL"))
+WEBHOOK_PATH = clean_env_var(os.getenv("WEBHOOK_PATH")) or "/telegram"  # route on the health server
+WEBHOOK_SECRET = clean_env_var(os.getenv("WEBHOOK_SECRET"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+
+# Stream LLM replies into Telegram, editing one message as text arrives
+LLM_STREAMING = os.getenv("LLM_STREAMING", "0") == "1"
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "20"))  # text needed before the first message is sent
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # seconds between edits of one message
+
+# Cache of read-only backend tool responses (product list, product, storefront), 0 TTL disables it
+TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "120"))  # seconds
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))
+
+# Per-chat auth sessions, so tools reuse the vendor token instead of the model passing it around
+AUTH_SESSION_TTL = float(os.getenv("AUTH_SESSION_TTL", "3600"))  # seconds, used when the token carries no expiry
+AUTH_REFRESH_MARGIN = float(os.getenv("AUTH_REFRESH_MARGIN", "60"))  # re-authenticate this long before expiry
+AUTH_SESSION_MAX_ENTRIES = int(os.getenv("AUTH_SESSION_MAX_ENTRIES", "10000"))
+
+# AI product images: generated by a DB-backed job queue, the photo is sent to the chat when done
+AI_IMAGE_MODEL = clean_env_var(os.getenv("AI_IMAGE_MODEL")) or "google/gemini-2.5-flash-image-preview"
+IMAGE_QUEUE_WORKERS = int(os.getenv("IMAGE_QUEUE_WORKERS", "8"))
+IMAGE_QUEUE_MODEL_CONCURRENCY = int(os.getenv("IMAGE_QUEUE_MODEL_CONCURRENCY", "4"))  # jobs calling one model at once
+IMAGE_QUEUE_MAX_ATTEMPTS = int(os.getenv("IMAGE_QUEUE_MAX_ATTEMPTS", "3"))
+IMAGE_QUEUE_RETRY_DELAY = float(os.getenv("IMAGE_QUEUE_RETRY_DELAY", "5"))  # seconds, doubles after each failed attempt
+IMAGE_QUEUE_POLL_INTERVAL = float(os.getenv("IMAGE_QUEUE_POLL_INTERVAL", "5"))  # seconds between checks for due retries
+# Seconds a worker's claim on a job lasts, longer than any generation and upload. Expired
+# claims (their process stopped) are requeued by any replica.
+IMAGE_QUEUE_LEASE = float(os.getenv("IMAGE_QUEUE_LEASE", "900"))
+# Upload generated images as raw bytes in a multipart "image" file field instead of base64 JSON,
+# only for backends whose upload endpoints accept it
+AI_IMAGE_UPLOAD_MULTIPART = os.getenv("AI_IMAGE_UPLOAD_MULTIPART", "0") == "1"
+# Generated images are cached by source image, product name and prompt, so repeats don't rerun the model
+AI_IMAGE_CACHE_TTL = float(os.getenv("AI_IMAGE_CACHE_TTL", "86400"))  # seconds
+AI_IMAGE_CACHE_MAX_BYTES = int(os.getenv("AI_IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Add cache_control breakpoints to the prompt for models that need them to cache (Anthropic, Gemini)
+PROMPT_CACHE_HINTS = os.getenv("PROMPT_CACHE_HINTS", "1") == "1"
+
+# Send only the tools of the prompt.md flow a turn is in, every tool when the flow is unclear
+TOOL_SUBSETS = os.getenv("TOOL_SUBSETS", "1") == "1"
+
+# Answer the fixed steps of the flows (next question, upload more, confirmation) without calling the LLM
+SCRIPTED_REPLIES = os.getenv("SCRIPTED_REPLIES", "1") == "1"
+
+# Tool results sent to the model keep only the fields the flows use, with lists and text capped;
+# the full result stays fetchable through fetch_tool_result for TOOL_RESULT_TTL
+TOOL_RESULT_SHAPING = os.getenv("TOOL_RESULT_SHAPING", "1") == "1"
+TOOL_RESULT_LIST_LIMIT = int(os.getenv("TOOL_RESULT_LIST_LIMIT", "20"))  # items per list
+TOOL_RESULT_STRING_LIMIT = int(os.getenv("TOOL_RESULT_STRING_LIMIT", "500"))  # characters per text field
+TOOL_RESULT_TTL = float(os.getenv("TOOL_RESULT_TTL", "3600"))  # seconds
+TOOL_RESULT_MAX_BYTES = int(os.getenv("TOOL_RESULT_MAX_BYTES", str(64 * 1024 * 1024)))
@@ -1,4 +1,5 @@
 from aiohttp import web
+from metrics import metrics_handler
 
 async def health_check(request):
     return web.Response(text="OK, v-1.0.0")
@@ -6,4 +7,5 @@ async def health_check(request):
 def create_health_app():
     app = web.Application()
     app.router.add_get("", health_check)
+    app.router.add_get("/metrics", metrics_handler)
     return app
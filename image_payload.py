@@ -0,0 +1,70 @@
+import binascii
+import io
+import json
+import aiohttp
+from aiohttp.payload import Payload
+
+# Bytes handed to the connection per write, so a large body is never buffered whole by the transport
+_CHUNK_SIZE = 256 * 1024
+
+
+def parse_data_url(data_url: str) -> tuple[str, memoryview]:
+    """
+    Split a base64 `data:` URL into its media type and body.
+
+    The body is a memoryview into a single ASCII copy of the URL, not a new string.
+    """
+    raw = data_url.encode("ascii")
+    comma = raw.find(b",")
+    if not raw.startswith(b"data:") or comma < 0:
+        raise ValueError("not a data URL")
+    media_type = raw[5:comma].decode().removesuffix(";base64") or "application/octet-stream"
+    return media_type, memoryview(raw)[comma + 1:]
+
+
+class Base64JSONPayload(Payload):
+    """
+    JSON object body whose last field is a large base64 string, written straight from a memoryview.
+
+    Equivalent to `json=dict(fields, **{field_name: body})` without building that string
+    (base64 needs no JSON escaping). Sent with a Content-Length, not chunked.
+    """
+
+    _default_content_type = "application/json"
+
+    def __init__(self, fields: dict, field_name: str, body: memoryview, **kwargs):
+        head = json.dumps(fields)[:-1]
+        head = (head + ", " if fields else head) + json.dumps(field_name) + ': "'
+        parts = (head.encode(), body, b'"}')
+        super().__init__(parts, **kwargs)
+        self._size = sum(len(part) for part in parts)
+
+    def decode(self, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return b"".join(self._value).decode(encoding, errors)
+
+    async def write(self, writer) -> None:
+        await self.write_with_length(writer, None)
+
+    async def write_with_length(self, writer, content_length) -> None:
+        remaining = self._size if content_length is None else content_length
+        for part in self._value:
+            view = memoryview(part)
+            for start in range(0, len(view), _CHUNK_SIZE):
+                if remaining <= 0:
+                    return
+                chunk = view[start:start + min(_CHUNK_SIZE, remaining)]
+                await writer.write(chunk)
+                remaining -= len(chunk)
+
+
+def raw_image_form(fields: dict, field_name: str, body: memoryview, media_type: str) -> aiohttp.FormData:
+    """Multipart form with the base64 body decoded to raw bytes as a file, 25% smaller on the wire."""
+    data = aiohttp.FormData()
+    for name, value in fields.items():
+        if value is not None:
+            data.add_field(name, str(value))
+    extension = media_type.rsplit("/", 1)[-1]
+    # BytesIO shares the decoded bytes and is sent in chunks, plain bytes would be written (and buffered) whole
+    image = io.BytesIO(binascii.a2b_base64(body))
+    data.add_field(field_name, image, filename=f"ai_image.{extension}", content_type=media_type)
+    return data
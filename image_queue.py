@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from ai_image import AIImageError, generate_ai_image_url
+from models import (
+    add_image_job_orm,
+    claim_image_job_orm,
+    update_image_job_orm,
+    release_image_jobs_orm,
+    requeue_expired_image_jobs_orm,
+)
+from config import (
+    AI_IMAGE_MODEL,
+    IMAGE_QUEUE_WORKERS,
+    IMAGE_QUEUE_MODEL_CONCURRENCY,
+    IMAGE_QUEUE_MAX_ATTEMPTS,
+    IMAGE_QUEUE_RETRY_DELAY,
+    IMAGE_QUEUE_POLL_INTERVAL,
+    IMAGE_QUEUE_LEASE,
+)
+
+
+class ImageJobQueue:
+    """
+    AI image generations persisted in the image_jobs table and run by a pool of workers.
+
+    enqueue() returns as soon as the job is stored; a worker generates and uploads the
+    image and sends it to the chat. Failed attempts are retried with a growing delay up to
+    `max_attempts`, at most `model_concurrency` jobs call the same model at once. Each claim
+    records its worker and time. close() puts this process's running jobs back in the
+    queue right away; jobs whose claim is older than `lease` (their process crashed) are
+    picked up again by any replica.
+
+    Jobs never store the vendor token, only the chat and its phone number. Each attempt
+    gets the chat's current token from the session store, which logs in again when needed.
+    """
+
+    def __init__(self, workers: int, model_concurrency: int, max_attempts: int, retry_delay: float,
+                 poll_interval: float, lease: float):
+        self.workers = workers
+        self.model_concurrency = model_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._next_recovery = 0.0
+        self._bot = None
+        self._sessions = None
+        self._tasks: list[asyncio.Task] = []
+        self._wake = asyncio.Event()
+        self._model_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def start(self, bot, sessions):
+        self._bot = bot
+        self._sessions = sessions
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Cancelled jobs go back to the queue for the next process, not after the lease
+        try:
+            released = await release_image_jobs_orm(self.worker_id)
+        except Exception as e:
+            print(f"Releasing running AI image jobs failed: {e}")
+            return
+        if released:
+            print(f"Requeued {released} AI image jobs still running at shutdown")
+
+    async def enqueue(self, chat_id, product_name, image_url, product_id=None, store_id=None, caption=None) -> int:
+        session = self._sessions.get(chat_id)
+        payload = {
+            "phone_no": session.phone_no if session else None,
+            "product_name": product_name,
+            "image_url": image_url,
+            "product_id": product_id,
+            "store_id": store_id,
+            "caption": caption,
+        }
+        job = await add_image_job_orm(chat_id, AI_IMAGE_MODEL, json.dumps(payload))
+        self._wake.set()
+        return job.id
+
+    async def _recover(self):
+        """Requeue jobs whose claim expired, at most once per lease/10 across this process's workers."""
+        self._next_recovery = time.monotonic() + self.lease / 10
+        try:
+            recovered = await requeue_expired_image_jobs_orm(self.lease)
+        except Exception as e:
+            print(f"Requeuing expired AI image jobs failed: {e}")
+            return
+        if recovered:
+            print(f"Requeued {recovered} AI image jobs whose worker stopped")
+
+    async def _work(self):
+        while True:
+            if time.monotonic() >= self._next_recovery:
+                await self._recover()
+            try:
+                job = await claim_image_job_orm(self.worker_id)
+            except Exception as e:
+                print(f"Claiming AI image job failed: {e}")
+                job = None
+            if job is None:
+                # Sleep until a job is enqueued, or a retry becomes due
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # Keep the worker alive, the job is requeued at shutdown or when its lease expires
+                print(f"AI image job {job.id} crashed: {e}\n{traceback.format_exc()}")
+
+    async def _run(self, job):
+        payload = json.loads(job.payload)
+        caption = payload.pop("caption")
+        phone_no = payload.pop("phone_no")
+        slots = self._model_slots.setdefault(job.model, asyncio.Semaphore(self.model_concurrency))
+        try:
+            # Finish well inside the lease, or another replica would run the job again
+            image_url = await asyncio.wait_for(self._generate(slots, job.chat_id, phone_no, payload),
+                                               timeout=self.lease / 2)
+        except Exception as e:
+            retry = getattr(e, "retry", True) and job.attempts < self.max_attempts
+            print(f"AI image job {job.id} attempt {job.attempts} failed: {e}\n"
+                  f"{'' if isinstance(e, AIImageError) else traceback.format_exc()}")
+            if retry:
+                delay = self.retry_delay * 2 ** (job.attempts - 1)
+                await update_image_job_orm(job.id, status="pending", error=str(e),
+                                           run_after=datetime.utcnow() + timedelta(seconds=delay))
+            else:
+                await update_image_job_orm(job.id, status="failed", error=str(e), payload="{}")
+                await self._send(job.chat_id, text=f"❌ AI image generation failed:\n{e}")
+            return
+
+        await update_image_job_orm(job.id, status="done", result_url=image_url, error=None, payload="{}")
+        await self._send(job.chat_id, photo=image_url, caption=caption)
+
+    async def _generate(self, slots, chat_id, phone_no, payload):
+        # After a restart the chat has no session in this process yet
+        if self._sessions.get(chat_id) is None and phone_no:
+            await self._sessions.login(chat_id, phone_no)
+        async with slots:
+            result = await self._sessions.call(chat_id, generate_ai_image_url, payload)
+        if isinstance(result, dict):
+            raise AIImageError(result["error"], retry=False)
+        return result
+
+    async def _send(self, chat_id, text=None, photo=None, caption=None):
+        try:
+            if photo:
+                await self._bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+            else:
+                await self._bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            print(f"Sending AI image job result to chat {chat_id} failed: {e}")
+
+
+image_queue = ImageJobQueue(
+    workers=IMAGE_QUEUE_WORKERS,
+    model_concurrency=IMAGE_QUEUE_MODEL_CONCURRENCY,
+    max_attempts=IMAGE_QUEUE_MAX_ATTEMPTS,
+    retry_delay=IMAGE_QUEUE_RETRY_DELAY,
+    poll_interval=IMAGE_QUEUE_POLL_INTERVAL,
+    lease=IMAGE_QUEUE_LEASE,
+)
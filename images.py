@@ -0,0 +1,131 @@
+import asyncio
+import io
+from contextlib import asynccontextmanager
+import aiohttp
+from backend import get_session
+from config import IMAGE_FETCH_CONCURRENCY, IMAGE_FETCH_TIMEOUT, IMAGE_MAX_BYTES, IMAGE_UPLOAD_STREAMING
+
+_CHUNK_SIZE = 64 * 1024
+
+# Caps concurrent downloads across all chats, which also bounds image bytes held in memory
+_semaphore = asyncio.Semaphore(IMAGE_FETCH_CONCURRENCY)
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+async def fetch_image(url: str, max_bytes: int = IMAGE_MAX_BYTES, timeout: float = IMAGE_FETCH_TIMEOUT) -> bytearray:
+    """
+    Download one image into a single buffer, failing on non-200 responses, on images
+    larger than `max_bytes` and after `timeout` seconds.
+    """
+    session = get_session()
+    async with _semaphore:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                raise ImageFetchError(f"HTTP {response.status}")
+            size = response.content_length
+            if size is not None and size > max_bytes:
+                raise ImageFetchError(f"image is {size} bytes, limit is {max_bytes}")
+
+            if size is not None:
+                # Known length: fill a preallocated buffer, no intermediate copies
+                buffer = bytearray(size)
+                view = memoryview(buffer)
+                received = 0
+                async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                    if received + len(chunk) > size:
+                        raise ImageFetchError("image is larger than its Content-Length")
+                    view[received:received + len(chunk)] = chunk
+                    received += len(chunk)
+                if received != size:
+                    raise ImageFetchError(f"image truncated at {received} of {size} bytes")
+                return buffer
+
+            buffer = bytearray()
+            async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                buffer += chunk
+                if len(buffer) > max_bytes:
+                    raise ImageFetchError(f"image exceeds {max_bytes} bytes")
+            return buffer
+
+
+async def fetch_images(urls) -> list[bytearray | None]:
+    """Download all images at once, in input order; failed downloads are None."""
+    async def fetch(url):
+        try:
+            return await fetch_image(url)
+        except (ImageFetchError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to download image from {url}: {e}")
+            return None
+
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+async def stream_image(url: str, max_bytes: int = IMAGE_MAX_BYTES, timeout: float = IMAGE_FETCH_TIMEOUT):
+    """
+    Yield an image download chunk by chunk. The download only starts when the first chunk
+    is requested, so a multipart upload pulls each image in as it reaches that part.
+    """
+    session = get_session()
+    async with _semaphore:
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            if response.status != 200:
+                raise ImageFetchError(f"HTTP {response.status} for {url}")
+            if response.content_length is not None and response.content_length > max_bytes:
+                raise ImageFetchError(f"image is {response.content_length} bytes, limit is {max_bytes}")
+            received = 0
+            async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise ImageFetchError(f"image exceeds {max_bytes} bytes")
+                yield chunk
+
+
+@asynccontextmanager
+async def image_parts(urls):
+    """
+    Image bodies for a multipart upload, in input order.
+
+    By default all images are downloaded concurrently first (see fetch_images). With
+    IMAGE_UPLOAD_STREAMING each image is streamed from Telegram straight into the
+    outgoing request body, so an upload holds a few chunks in memory whatever the image
+    size. Images are then downloaded one after another, and a failed download fails the
+    whole upload with ImageFetchError instead of skipping that image.
+    """
+    if not IMAGE_UPLOAD_STREAMING:
+        yield await fetch_images(urls)
+        return
+    failures = []
+
+    async def recording(stream):
+        try:
+            async for chunk in stream:
+                yield chunk
+        except (ImageFetchError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failures.append(e)
+            raise
+
+    streams = [stream_image(url) for url in urls]
+    try:
+        yield [recording(stream) for stream in streams]
+    except Exception:
+        # aiohttp reports a failed body as a connection error, name the download instead
+        if failures:
+            raise ImageFetchError(f"Failed to download image: {str(failures[0]) or type(failures[0]).__name__}") from None
+        raise
+    finally:
+        # Release downloads the upload did not finish reading
+        for stream in streams:
+            await stream.aclose()
+
+
+def add_image_fields(data: aiohttp.FormData, field_name: str, images):
+    """Attach downloaded images (or image streams) to a multipart form, sent in chunks."""
+    for i, image in enumerate(images):
+        if isinstance(image, (bytes, bytearray)):
+            # A raw buffer is written whole (aiohttp warns above 1 MB), BytesIO is sent in chunks
+            image = io.BytesIO(image)
+        if image is not None:
+            data.add_field(field_name, image, filename=f'image_{i}.jpg', content_type='image/jpeg')
@@ -0,0 +1,175 @@
+import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from metrics import llm_wait_seconds, llm_request_seconds, llm_first_token_seconds, llm_tokens, llm_errors_total
+from config import (
+    OPENROUTER_API_KEY,
+    OPENROUTER_BASE_URL,
+    LLM_MAX_CONCURRENCY,
+    LLM_RATE_LIMIT_RPM,
+    LLM_RATE_LIMIT_BURST,
+)
+
+# httpcore scans every pooled connection on each request, which gets quadratic once a
+# single pool holds dozens of connections. Spread the load over several small clients.
+_CONNECTIONS_PER_CLIENT = 16
+
+
+def _build_client(max_connections: int) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        base_url=OPENROUTER_BASE_URL,
+        api_key=OPENROUTER_API_KEY,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        ),
+    )
+
+
+# Shared async OpenAI clients via OpenRouter
+_clients = [
+    _build_client(_CONNECTIONS_PER_CLIENT)
+    for _ in range(max(1, -(-LLM_MAX_CONCURRENCY // _CONNECTIONS_PER_CLIENT)))
+]
+_next_client = itertools.cycle(_clients)
+
+
+def get_client() -> AsyncOpenAI:
+    """Round-robin over the shared clients."""
+    return next(_next_client)
+
+
+class RateLimiter:
+    """
+    Token bucket allowing `rate_per_minute` requests per minute with bursts of up to `burst`.
+    Callers reserve a token under the lock and sleep outside it, so waiters are served in order.
+    """
+
+    def __init__(self, rate_per_minute: int, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# Global cap on in-flight LLM requests across all chats
+_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+# One limiter per model, OpenRouter rate limits are applied per model
+_rate_limiters: dict[str, RateLimiter] = {}
+
+
+def get_rate_limiter(model: str) -> RateLimiter | None:
+    if LLM_RATE_LIMIT_RPM <= 0:
+        return None
+    limiter = _rate_limiters.get(model)
+    if limiter is None:
+        limiter = _rate_limiters[model] = RateLimiter(LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_BURST)
+    return limiter
+
+
+@asynccontextmanager
+async def llm_slot(model: str, stream: bool = False):
+    """Wait for the model's rate limiter and a global concurrency slot, then time the request."""
+    waiting = time.perf_counter()
+    limiter = get_rate_limiter(model)
+    if limiter:
+        await limiter.acquire()
+    async with _semaphore:
+        started = time.perf_counter()
+        llm_wait_seconds.observe(started - waiting, model=model)
+        try:
+            yield
+        except Exception:
+            llm_errors_total.inc(model=model)
+            raise
+        finally:
+            llm_request_seconds.observe(time.perf_counter() - started, model=model, stream="true" if stream else "false")
+
+
+def _record_usage(model: str, usage):
+    if usage is None:
+        return
+    details = usage.prompt_tokens_details
+    cached = (details.cached_tokens or 0) if details else 0
+    llm_tokens.observe(usage.prompt_tokens, model=model, direction="in")
+    llm_tokens.observe(cached, model=model, direction="cached")
+    llm_tokens.observe(usage.completion_tokens, model=model, direction="out")
+    print(f"LLM usage ({model}): {usage.prompt_tokens} prompt tokens, {cached} cached, "
+          f"{usage.prompt_tokens - cached} uncached, {usage.completion_tokens} completion")
+
+
+async def chat_completion(**kwargs):
+    """Non-blocking chat.completions.create bounded by the concurrency and rate limits."""
+    async with llm_slot(kwargs["model"]):
+        response = await get_client().chat.completions.create(**kwargs)
+    _record_usage(kwargs["model"], response.usage)
+    return response
+
+
+async def stream_chat_completion(on_text=None, **kwargs) -> ChatCompletionMessage:
+    """
+    Stream a chat completion and return the assembled assistant message.
+    `await on_text(text)` is called with the full text so far whenever new content arrives.
+    Tool call deltas are merged by index: id and name arrive once, arguments in pieces.
+    """
+    content = ""
+    tool_calls: dict[int, dict] = {}
+    first_token = None
+    async with llm_slot(kwargs["model"], stream=True):
+        started = time.perf_counter()
+        stream = await get_client().chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        async for chunk in stream:
+            # The usage chunk comes last, with no choices
+            _record_usage(kwargs["model"], chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if first_token is None and (delta.content or delta.tool_calls):
+                first_token = time.perf_counter()
+                llm_first_token_seconds.observe(first_token - started, model=kwargs["model"])
+            for tool_call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(tool_call.index, {"id": None, "name": None, "arguments": ""})
+                if tool_call.id:
+                    entry["id"] = tool_call.id
+                if tool_call.function:
+                    if tool_call.function.name:
+                        entry["name"] = tool_call.function.name
+                    if tool_call.function.arguments:
+                        entry["arguments"] += tool_call.function.arguments
+            if delta.content:
+                content += delta.content
+                if on_text:
+                    await on_text(content)
+
+    return ChatCompletionMessage(
+        role="assistant",
+        content=content or None,
+        tool_calls=[
+            ChatCompletionMessageToolCall(
+                id=entry["id"],
+                type="function",
+                function=Function(name=entry["name"], arguments=entry["arguments"] or "{}"),
+            )
+            for _, entry in sorted(tool_calls.items())
+        ] or None,
+    )
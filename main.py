@@ -1,33 +1,55 @@
 import asyncio
-import json
 import logging
+import signal
+import time
 from typing import Any, Dict, List
 import requests
 from telegram import Update
 from telegram.ext import ApplicationBuilder, ContextTypes, MessageHandler, filters
 from telegram import Message, PhotoSize
 from telegram.ext import ContextTypes
-from openai import OpenAI
-from config import BOT_TOKEN, OPENROUTER_API_KEY, MODEL
-from tools import TOOL_MAPPING
+from config import (
+    BOT_TOKEN,
+    MODEL,
+    CHAT_DEBOUNCE_MS,
+    CHAT_IDLE_TIMEOUT,
+    ALBUM_WINDOW_MS,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    LLM_STREAMING,
+    SCRIPTED_REPLIES,
+    STREAM_MIN_CHARS,
+    STREAM_EDIT_INTERVAL,
+)
+from chat_queue import ChatScheduler
+from albums import AlbumAggregator, best_photo_size
+from llm import chat_completion, stream_chat_completion
+from streaming import StreamingReply
+from tool_executor import run_tool_calls
 from tools_def import tools
-from models import save_message_orm, get_conversation_messages_orm
+from prompt import build_messages
+from tool_selector import select_tools, tokens_saved as tool_tokens_saved
+from scripted import scripted_reply
+from models import save_message_orm, save_messages_orm, get_recent_messages_orm, get_summary_orm, init_db, message_writer
+from summary import schedule_summary, summary_message, tokens_saved
 import threading
 from health import create_health_app
+from webhook import WebhookIngress
+from backend import backend
+from image_queue import image_queue
+from metrics import TimedHTTPXRequest, register_stats, turn_seconds, llm_tool_subset_total, scripted_replies_total
+from models import summary_cache, transcript_cache
+from tool_cache import cache_stats
+from sessions import session_store
+from ai_image import ai_images
+from tool_results import tool_results
 from aiohttp import web
 import nest_asyncio
 nest_asyncio.apply()  # Patch the event loop to allow reentry
 
-# OpenAI via OpenRouter
-openai_client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY,
-)
-
-# System prompt
-with open("prompt.md", "r", encoding="utf-8") as f:
-    system_prompt = f.read()
-
 # Utility: get image URL from Telegram file_id
 async def get_telegram_file_url(context: ContextTypes.DEFAULT_TYPE, file_id: str) -> str:
     try:
@@ -36,25 +58,17 @@ async def get_telegram_file_url(context: ContextTypes.DEFAULT_TYPE, file_id: str
     except Exception as e:
         return f"Error fetching file: {e}"
 
-# Main processing logic for LLM + tool
-async def process_llm(update: Update, user_content: str):
-    """
-    Processes a user message, handling single or multi-turn tool calls in a loop
-    before providing a final response.
-    """
-    chat_id = str(update.effective_chat.id)
-
-    # 1. Load and format conversation history
-    conversation_history = await get_conversation_messages_orm(chat_id)
-    messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
+def format_history(conversation_history) -> List[Dict[str, Any]]:
+    """Convert stored Message rows into chat completion messages."""
+    messages: List[Dict[str, Any]] = []
     for msg in conversation_history:
         if msg.role == "system":
             continue
-        
+
         formatted = {"role": msg.role, "content": msg.content}
         if msg.role == "tool" and msg.tool_call_id:
             formatted["tool_call_id"] = msg.tool_call_id
-        
+
         if msg.role == "assistant" and msg.name and msg.tool_call_id:
             formatted["tool_calls"] = [{
                 "id": msg.tool_call_id,
@@ -62,23 +76,75 @@ async def process_llm(update: Update, user_content: str):
                 "type": "function",
             }]
             formatted["content"] = None
-        
+
         messages.append(formatted)
+    return messages
+
+# Main processing logic for LLM + tool
+async def process_llm(update: Update, user_content: str):
+    """
+    Processes a user message, handling single or multi-turn tool calls in a loop
+    before providing a final response.
+    """
+    chat_id = str(update.effective_chat.id)
+    started = time.perf_counter()
+
+    # 1. Load the running summary and the recent history not folded into it
+    summary = await get_summary_orm(chat_id)
+    conversation_history = await get_recent_messages_orm(
+        chat_id, after_id=summary.last_message_id if summary else None
+    )
+    if summary:
+        print(f"Conversation summary saved ~{tokens_saved(summary)} prompt tokens for chat {chat_id}")
+
+    history = format_history(conversation_history)
+
+    # Scripted flow steps are answered locally, the LLM only sees free-form and tool steps
+    scripted = scripted_reply(history, user_content, summarized=summary is not None) if SCRIPTED_REPLIES else None
+    if scripted:
+        step, final_text = scripted
+        await save_messages_orm(chat_id, [
+            {"role": "user", "content": user_content},
+            {"role": "assistant", "content": final_text},
+        ])
+        await update.message.reply_text(final_text)
+        scripted_replies_total.inc(step=step)
+        schedule_summary(chat_id)
+        turn_seconds.observe(time.perf_counter() - started)
+        return
 
-    # 2. Add new user message
-    messages.append({"role": "user", "content": user_content})
+    # 2. Add new user message, after the unchanging system prompt prefix
+    messages = build_messages(MODEL, summary_message(summary) if summary else None, history, user_content)
+    flow, turn_tools = select_tools(history, user_content, summarized=summary is not None)
+    llm_tool_subset_total.inc(flow=flow)
+    if flow != "all":
+        print(f"Sending {len(turn_tools)}/{len(tools)} tools for the {flow} flow, "
+              f"~{tool_tokens_saved(turn_tools)} prompt tokens saved for chat {chat_id}")
     await save_message_orm(chat_id, "user", user_content)
 
     # 3. Start the conversation loop
+    reply = (
+        StreamingReply(update, clean_response_content, STREAM_MIN_CHARS, STREAM_EDIT_INTERVAL)
+        if LLM_STREAMING else None
+    )
     while True:
-        # Make the API call
-        response = openai_client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
-        )
-        assistant_msg = response.choices[0].message
+        # Make the API call (awaited, so other chats keep running meanwhile)
+        if reply:
+            assistant_msg = await stream_chat_completion(
+                on_text=reply.show,
+                model=MODEL,
+                messages=messages,
+                tools=turn_tools,
+                tool_choice="auto",
+            )
+        else:
+            response = await chat_completion(
+                model=MODEL,
+                messages=messages,
+                tools=turn_tools,
+                tool_choice="auto",
+            )
+            assistant_msg = response.choices[0].message
 
         # If there are no tool calls, this is the final response
         if not assistant_msg.tool_calls:
@@ -90,7 +156,12 @@ async def process_llm(update: Update, user_content: str):
             
             # Save and send the final response
             await save_message_orm(chat_id, "assistant", final_text)
-            await update.message.reply_text(final_text)
+            if reply:
+                await reply.finish(final_text)
+            else:
+                await update.message.reply_text(final_text)
+            schedule_summary(chat_id)
+            turn_seconds.observe(time.perf_counter() - started)
             return  # Exit the function
 
         # --- If there ARE tool calls, process them ---
@@ -110,35 +181,19 @@ async def process_llm(update: Update, user_content: str):
             ]
         })
 
-        # Process each tool call requested in this turn
-        for tool_call in assistant_msg.tool_calls:
+        # Run the tool calls requested in this turn, its rows are saved together below
+        tool_contents = await run_tool_calls(update, assistant_msg.tool_calls)
+        turn_rows = []
+        for tool_call, tool_content in zip(assistant_msg.tool_calls, tool_contents):
             tool_name = tool_call.function.name
-            tool_args = json.loads(tool_call.function.arguments)
-
-            # Save the assistant's request to call a tool
-            await save_message_orm(
-                chat_id,
-                role="assistant",
-                content=tool_call.function.arguments,
-                name=tool_name,
-                tool_call_id=tool_call.id
-            )
 
-            print(f"Executing tool: {tool_name} with args: {tool_args}")
-            try:
-                # Special handling for tools that need extra context
-                if tool_name == "generate_ai_image":
-                    tool_args["update"] = update
-                if tool_name == "create_product":
-                    tool_args["update"] = update
-                # Call the corresponding tool function
-                tool_result = await TOOL_MAPPING[tool_name](**tool_args)
-                tool_content = json.dumps(tool_result)
-
-            except Exception as e:
-                # Gracefully handle tool failure
-                print(f"Tool call error for {tool_name}: {e}")
-                tool_content = json.dumps({"error": f"Something went wrong while executing {tool_name}: {e}"})
+            # Record the assistant's request to call a tool
+            turn_rows.append({
+                "role": "assistant",
+                "content": tool_call.function.arguments,
+                "name": tool_name,
+                "tool_call_id": tool_call.id,
+            })
 
             # Append the tool's result to the message history for the next iteration
             messages.append({
@@ -147,7 +202,14 @@ async def process_llm(update: Update, user_content: str):
                 "name": tool_name,
                 "content": tool_content,
             })
-            await save_message_orm(chat_id, "tool", tool_content, name=tool_name, tool_call_id=tool_call.id)
+            turn_rows.append({
+                "role": "tool",
+                "content": tool_content,
+                "name": tool_name,
+                "tool_call_id": tool_call.id,
+            })
+
+        await save_messages_orm(chat_id, turn_rows)
 
 
 def clean_response_content(content: str) -> str:
@@ -187,10 +249,30 @@ def clean_response_content(content: str) -> str:
     result = '\n'.join(cleaned_lines).strip()
     return result if result else "Done."
 
+# One ordered worker per chat, so quick successive messages from a seller become one turn
+chat_scheduler = ChatScheduler(
+    process_llm,
+    debounce=CHAT_DEBOUNCE_MS / 1000,
+    idle_timeout=CHAT_IDLE_TIMEOUT,
+)
+
 # Text message handler
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text
-    await process_llm(update, user_input)
+    chat_scheduler.submit(str(update.effective_chat.id), update, user_input)
+
+async def handle_album(items):
+    """Send all photos of an album to the LLM as one message, resolving their URLs at once."""
+    image_urls = await asyncio.gather(*(
+        get_telegram_file_url(context, best_photo_size(update.message.photo).file_id)
+        for update, context in items
+    ))
+    print(image_urls)
+    update = items[-1][0]
+    user_content = "User uploaded the following images:\n" + "\n".join(image_urls)
+    chat_scheduler.submit(str(update.effective_chat.id), update, user_content)
+
+album_aggregator = AlbumAggregator(handle_album, window=ALBUM_WINDOW_MS / 1000)
 
 # Image upload handler
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -201,30 +283,104 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await message.reply_text("No Image received.")
         return
 
+    # Photos sent as an album arrive as separate updates, collect them into one turn
+    if message.media_group_id:
+        album_aggregator.add(message.media_group_id, update, context)
+        return
+
     # Get only the highest resolution photo per message
-    best_photo: PhotoSize = max(message.photo, key=lambda p: p.file_size)
-    image_url: str = await get_telegram_file_url(context, best_photo.file_id)
-    print(image_url)
-    user_content = f"User uploaded the following image: {image_url}"
-    await process_llm(update, user_content)
-
-async def run_health_server():
-    app = create_health_app()
+    best_photo: PhotoSize = best_photo_size(message.photo)
+
+    async def user_content() -> str:
+        # Resolved by the chat's worker, so the photo keeps its place among the chat's messages
+        image_url: str = await get_telegram_file_url(context, best_photo.file_id)
+        print(image_url)
+        return f"User uploaded the following image: {image_url}"
+
+    chat_scheduler.submit(str(chat_id), update, user_content)
+
+async def run_health_server(app):
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, port=8080)
     await site.start()
     print("✅ Health server running on port 8080")
 
+async def on_startup(app):
+    message_writer.start()
+    await image_queue.start(app.bot, session_store)
+
+async def on_shutdown(app):
+    await chat_scheduler.close()
+    await image_queue.close()
+    # Flush queued messages before the process exits
+    await message_writer.close()
+    await backend.close()
+
+async def run_webhook(app, ingress: WebhookIngress):
+    """Serve updates pushed by Telegram to the health server until SIGINT/SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    await on_startup(app)
+    await app.start()
+    ingress.start()
+    await app.bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    print(f"🤖 Bot is receiving updates via webhook at {WEBHOOK_URL}")
+    try:
+        await stop.wait()
+    finally:
+        await ingress.close()
+        await app.stop()
+        await on_shutdown(app)
+        await app.shutdown()
+
 async def setup_and_start():
-    await run_health_server()
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        # Without it anyone who finds WEBHOOK_PATH can post updates as any chat
+        raise RuntimeError("WEBHOOK_SECRET must be set to use webhook mode (WEBHOOK_URL)")
+    await init_db()
+    await backend.start()
 
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # Handle updates from different chats concurrently instead of one at a time
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(True)
+        .request(TimedHTTPXRequest(connection_pool_size=256))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-    print("🤖 Bot is running...")
+
+    health_app = create_health_app()
+    register_stats("tool_cache", cache_stats)
+    register_stats("transcript_cache", transcript_cache.stats)
+    register_stats("summary_cache", summary_cache.stats)
+    register_stats("auth_sessions", session_store.stats)
+    register_stats("ai_images", ai_images.stats)
+    register_stats("tool_results", tool_results.stats)
+    ingress = None
+    if WEBHOOK_URL:
+        ingress = WebhookIngress(app, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS)
+        health_app.router.add_post(WEBHOOK_PATH, ingress.handle)
+    await run_health_server(health_app)
+
     print(f"🧠 Using model: {MODEL}")
-    await app.run_polling()
+    if ingress:
+        await run_webhook(app, ingress)
+    else:
+        print("🤖 Bot is running...")
+        app.run_polling(close_loop=False)
 
 if __name__ == "__main__":
     asyncio.get_event_loop().run_until_complete(setup_and_start())
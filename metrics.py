@@ -0,0 +1,128 @@
+import bisect
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from telegram.request import HTTPXRequest
+
+# Seconds, from a fast DB query to a slow image generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+_metrics = []
+_stats_sources = []  # (prefix, callable returning a dict of numbers)
+
+
+def _format_labels(labelnames, values, extra=()) -> str:
+    pairs = [*zip(labelnames, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: dict[tuple, list] = {}  # labels -> [counts per bucket + inf, sum]
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register_stats(prefix: str, source):
+    """Export the numeric values of `source()` (a stats() dict) as gauges named fridayy_<prefix>_<key>."""
+    _stats_sources.append((prefix, source))
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for prefix, source in _stats_sources:
+        for key, value in source().items():
+            if isinstance(value, (int, float)):
+                name = f"fridayy_{prefix}_{key}"
+                lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    return web.Response(text=render(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+# -------------------------
+# METRICS
+# -------------------------
+
+turn_seconds = Histogram("fridayy_turn_seconds", "Time to handle one seller turn, from the LLM request to the final reply.")
+reply_first_visible_seconds = Histogram("fridayy_reply_first_visible_seconds", "Time from the start of a streamed turn to the first reply text the seller sees.")
+llm_wait_seconds = Histogram("fridayy_llm_wait_seconds", "Time waiting for the LLM concurrency and rate limits.", ["model"])
+llm_request_seconds = Histogram("fridayy_llm_request_seconds", "LLM request latency.", ["model", "stream"])
+llm_first_token_seconds = Histogram("fridayy_llm_first_token_seconds", "Time to the first streamed chunk with content or a tool call.", ["model"])
+llm_tokens = Histogram("fridayy_llm_tokens", "Tokens per LLM request (in, cached part of in, out).", ["model", "direction"], buckets=TOKEN_BUCKETS)
+llm_errors_total = Counter("fridayy_llm_errors_total", "LLM requests that raised.", ["model"])
+llm_tool_subset_total = Counter("fridayy_llm_tool_subset_total", "Seller turns by the flow whose tools were sent (all when unsure).", ["flow"])
+scripted_replies_total = Counter("fridayy_scripted_replies_total", "Seller turns answered from the flow script without an LLM call.", ["step"])
+tool_seconds = Histogram("fridayy_tool_seconds", "Tool call latency.", ["tool"])
+tool_calls_total = Counter("fridayy_tool_calls_total", "Tool calls.", ["tool"])
+tool_errors_total = Counter("fridayy_tool_errors_total", "Tool calls that raised or returned an error.", ["tool"])
+db_seconds = Histogram("fridayy_db_seconds", "Database statement latency.", ["statement"])
+telegram_seconds = Histogram("fridayy_telegram_seconds", "Telegram Bot API request latency.", ["method"])
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """PTB request backend recording each Bot API call's latency by method (sendMessage, editMessageText, ...)."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = "file_download" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        with telegram_seconds.time(method=api_method):
+            return await super().do_request(url, method, *args, **kwargs)
@@ -0,0 +1,67 @@
+"""
+Move large contents of existing messages into the blobs table.
+
+Adds the messages.blob_hash column when it is missing, so run it once before starting a
+version with blob storage (safe to re-run, rows already holding a reference are skipped):
+python migrate_blobs.py
+"""
+import asyncio
+import config
+from sqlalchemy import func, inspect, text, update
+from sqlalchemy.future import select
+from models import AsyncSessionLocal, Message, blob_ref, engine, init_db, insert_blobs
+
+BATCH_SIZE = 500
+
+
+def _add_blob_hash_column(sync_conn):
+    # create_all does not add columns to the existing messages table
+    if "blob_hash" not in {column["name"] for column in inspect(sync_conn).get_columns("messages")}:
+        sync_conn.execute(text("ALTER TABLE messages ADD COLUMN blob_hash VARCHAR(64)"))
+        print("Added messages.blob_hash")
+
+
+async def migrate_blobs():
+    await init_db()
+    async with engine.begin() as conn:
+        await conn.run_sync(_add_blob_hash_column)
+    if not config.BLOB_MIN_CHARS:
+        print("BLOB_MIN_CHARS is 0, nothing to migrate")
+        return
+    last_id = 0
+    moved = 0
+    chars = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            async with session.begin():
+                result = await session.execute(
+                    select(Message.id, Message.content)
+                    .filter(
+                        Message.id > last_id,
+                        Message.blob_hash.is_(None),
+                        func.length(Message.content) >= config.BLOB_MIN_CHARS,
+                    )
+                    .order_by(Message.id)
+                    .limit(BATCH_SIZE)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                updates = []
+                blobs = []
+                for message_id, content in rows:
+                    ref, blob = blob_ref(content)
+                    updates.append({"id": message_id, "content": ref, "blob_hash": blob["hash"]})
+                    blobs.append(blob)
+                    chars += len(content)
+                await insert_blobs(session, blobs)
+                await session.execute(update(Message), updates)
+                moved += len(updates)
+        print(f"Moved {moved} message contents ({chars} characters) to blobs, up to message {last_id}")
+    print(f"Done: {moved} messages now reference blobs. Reclaim the freed space with VACUUM.")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_blobs())
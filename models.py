@@ -1,12 +1,21 @@
 import config
-from sqlalchemy import Column, Integer, String, Text, DateTime, create_engine, ForeignKey
+from cache import LRUCache
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, LargeBinary, create_engine, ForeignKey
 from sqlalchemy.future import select
+from sqlalchemy import update, event, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
+import hashlib
 import logging
+import re
+import time
+import zlib
+from metrics import db_seconds
 
 # Suppress SQLAlchemy engine logs
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
@@ -22,25 +31,308 @@ class Message(Base):
     name = Column(String(100), nullable=True, default=None)  # new field for tool name
     tool_call_id = Column(String(100), nullable=True, default=None)  # new field for tool call id
     content = Column(Text, nullable=False)
+    blob_hash = Column(String(64), nullable=True, default=None)  # set when the text is in the blobs table
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+# Serves "newest N messages of a conversation" without scanning its whole history
+recent_messages_index = Index(
+    "ix_messages_conversation_id_id_desc",
+    Message.conversation_id,
+    Message.id.desc(),
+)
+
+class Blob(Base):
+    """A large message content, zlib-compressed and stored once per SHA-256 of its text."""
+    __tablename__ = 'blobs'
+
+    hash = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # characters of the decompressed text
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ConversationSummary(Base):
+    __tablename__ = 'conversation_summaries'
+
+    conversation_id = Column(String(64), primary_key=True)
+    summary = Column(Text, nullable=False)
+    last_message_id = Column(Integer, nullable=False)  # newest message folded into the summary
+    summarized_tokens = Column(Integer, nullable=False, default=0)  # estimated tokens of the folded messages
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ImageJob(Base):
+    __tablename__ = 'image_jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(String(64), nullable=False)
+    model = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON arguments of the generation
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    claimed_by = Column(String(100), nullable=True)  # worker process running the job
+    claimed_at = Column(DateTime, nullable=True)  # start of the claim, a lease older than IMAGE_QUEUE_LEASE has expired
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # retry backoff
+    result_url = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+image_jobs_due_index = Index("ix_image_jobs_status_run_after", ImageJob.status, ImageJob.run_after)
+
 # DB setup
 DATABASE_URL = config.DATABASE_URL
 engine = create_async_engine(DATABASE_URL, echo=True)
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Time every statement, labelled by its verb (select, insert, update, delete)
+_STATEMENT_VERBS = {"select", "insert", "update", "delete"}
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._started = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    verb = statement.lstrip()[:6].lower()
+    db_seconds.observe(time.perf_counter() - context._started, statement=verb if verb in _STATEMENT_VERBS else "other")
+
+async def init_db():
+    """Create missing tables and indexes (create_all skips indexes on existing tables)."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(lambda sync_conn: recent_messages_index.create(sync_conn, checkfirst=True))
+        await conn.run_sync(lambda sync_conn: image_jobs_due_index.create(sync_conn, checkfirst=True))
+
+def _transcript_size(rows) -> int:
+    # Rough in-memory footprint: content plus a fixed per-row overhead
+    return sum(len(m.content or "") + 200 for m in rows)
+
+# Per-process cache of each hot conversation's newest HISTORY_MAX_MESSAGES rows (oldest first).
+# Writes go through to it, so active chats never re-read their history from the DB.
+transcript_cache = LRUCache(
+    max_entries=config.TRANSCRIPT_CACHE_MAX_CHATS,
+    ttl=config.TRANSCRIPT_CACHE_IDLE_TTL,
+    max_bytes=config.TRANSCRIPT_CACHE_MAX_BYTES,
+    sizeof=_transcript_size,
+    idle_ttl=True,
+)
+# Each hot conversation's summary row, or _NO_SUMMARY, next to its transcript
+summary_cache = LRUCache(max_entries=config.TRANSCRIPT_CACHE_MAX_CHATS, ttl=config.TRANSCRIPT_CACHE_IDLE_TTL, idle_ttl=True)
+_NO_SUMMARY = object()
+
+def _cache_append(conversation_id, messages):
+    rows = transcript_cache.peek(conversation_id)
+    if rows is None:
+        return
+    rows.extend(messages)
+    # Direct concurrent writers may commit out of id order, queued rows have no id yet
+    if len(rows) > len(messages) and None not in (rows[-len(messages) - 1].id, messages[0].id) \
+            and rows[-len(messages) - 1].id > messages[0].id:
+        rows.sort(key=lambda m: m.id)
+    del rows[:-config.HISTORY_MAX_MESSAGES]
+    transcript_cache.resize(conversation_id)
+
+# -------------------------
+# BLOBS
+# -------------------------
+
+# messages.content of a row with a blob_hash, the text is in the blobs table
+BLOB_REF = re.compile(r"blob:sha256:([0-9a-f]{64}):(\d+)")
+
+# hash -> decompressed text, filled on write so hot chats never read their blobs back
+_blob_texts = LRUCache(
+    max_entries=100_000,
+    max_bytes=config.BLOB_CACHE_MAX_BYTES,
+    sizeof=len,
+)
+
+def content_length(message) -> int:
+    """Characters of a message's text, without loading it when the text is in a blob."""
+    ref = BLOB_REF.fullmatch(message.content) if message.blob_hash else None
+    return int(ref.group(2)) if ref else len(message.content or "")
+
+def blob_ref(text: str) -> tuple[str, dict]:
+    """The reference that replaces `text` in a message row, and the blobs row holding it."""
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    _blob_texts.set(digest, text)
+    row = {"hash": digest, "data": zlib.compress(text.encode()), "size": len(text)}
+    return f"blob:sha256:{digest}:{len(text)}", row
+
+def _store_in_blob(message):
+    # The row is inserted with its message, see insert_messages_orm
+    if config.BLOB_MIN_CHARS and len(message.content or "") >= config.BLOB_MIN_CHARS:
+        message.content, message._blob = blob_ref(message.content)
+        message.blob_hash = message._blob["hash"]
+
+async def insert_blobs(session, rows):
+    """Insert blobs rows, skipping hashes that are already stored (the same content is never stored twice)."""
+    rows = list({row["hash"]: row for row in rows}.values())
+    if not rows:
+        return
+    dialect = session.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        await session.execute(insert(Blob).values(rows).on_conflict_do_nothing(index_elements=["hash"]))
+        return
+    result = await session.execute(select(Blob.hash).filter(Blob.hash.in_([row["hash"] for row in rows])))
+    stored = set(result.scalars().all())
+    session.add_all(Blob(**row) for row in rows if row["hash"] not in stored)
+
+async def expand_blobs(rows, copy: bool = True, session=None):
+    """
+    `rows` with the text of rows that have a blob_hash put back in place of their reference,
+    loading all missing blobs in one query.
+
+    With `copy` rows holding a reference are returned as detached copies, so cached
+    transcripts keep the short reference; rows only the caller holds are changed in place.
+    Pass the caller's `session` to load the blobs on its connection.
+    """
+    texts = {}
+    for m in rows:
+        if m.blob_hash and m.blob_hash not in texts:
+            texts[m.blob_hash] = _blob_texts.get(m.blob_hash)
+    missing = [digest for digest, text in texts.items() if text is None]
+    if missing:
+        query = select(Blob.hash, Blob.data).filter(Blob.hash.in_(missing))
+        if session is None:
+            async with AsyncSessionLocal() as session:
+                result = (await session.execute(query)).all()
+        else:
+            result = (await session.execute(query)).all()
+        for digest, data in result:
+            texts[digest] = zlib.decompress(data).decode()
+            _blob_texts.set(digest, texts[digest])
+    expanded = []
+    for m in rows:
+        text = texts.get(m.blob_hash) if m.blob_hash else None
+        if text is None:
+            expanded.append(m)
+            continue
+        if not copy:
+            m.content = text
+            m.blob_hash = None
+            expanded.append(m)
+            continue
+        expanded.append(Message(
+            id=m.id,
+            conversation_id=m.conversation_id,
+            role=m.role,
+            name=m.name,
+            tool_call_id=m.tool_call_id,
+            content=text,
+            timestamp=m.timestamp,
+        ))
+    return expanded
+
+class MessageWriter:
+    """
+    Write-behind queue that commits messages from many turns and chats in one bulk insert.
+
+    Rows waiting in the queue are collected for `flush_interval` seconds (or until
+    `max_batch` rows) and inserted in a single transaction, in enqueue order.
+    With `durable=True` callers wait until their rows are committed; otherwise they
+    return immediately and rows still queued are lost if the process dies.
+    close() flushes everything queued before it was called.
+    """
+
+    def __init__(self, flush_interval: float, max_batch: int, durable: bool):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.durable = durable
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if not self.running:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+
+    async def write(self, messages):
+        future = asyncio.get_running_loop().create_future() if self.durable else None
+        self._queue.put_nowait((messages, future))
+        if future:
+            await future
+
+    async def _run(self):
+        closing = False
+        while not closing:
+            item = await self._queue.get()
+            if item is None:
+                break
+            # Give other turns a moment to join this batch
+            if self.flush_interval:
+                await asyncio.sleep(self.flush_interval)
+            batch = [item]
+            rows = len(item[0])
+            while rows < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        messages = [m for msgs, _ in batch for m in msgs]
+        for attempt in range(3):
+            try:
+                await insert_messages_orm(messages)
+                break
+            except Exception as e:
+                error = e
+                await asyncio.sleep(0.1 * 2 ** attempt)
+        else:
+            print(f"Failed to persist {len(messages)} messages: {error}")
+            for _, future in batch:
+                if future and not future.done():
+                    future.set_exception(error)
+            return
+        for _, future in batch:
+            if future and not future.done():
+                future.set_result(None)
+
+message_writer = MessageWriter(
+    flush_interval=config.MESSAGE_FLUSH_INTERVAL_MS / 1000,
+    max_batch=config.MESSAGE_FLUSH_MAX_ROWS,
+    durable=config.MESSAGE_WRITE_MODE != "async",
+)
+
 # DB operations
-async def save_message_orm(conversation_id, role, content, name=None, tool_call_id=None):
+async def insert_messages_orm(messages):
+    """Insert Message rows, and the blobs their contents reference, in a single transaction."""
     async with AsyncSessionLocal() as session:
         async with session.begin():
-            message = Message(
-                conversation_id=conversation_id,
-                role=role,
-                content=content,
-                name=name,
-                tool_call_id=tool_call_id
-            )
-            session.add(message)
+            await insert_blobs(session, [m._blob for m in messages if getattr(m, "_blob", None)])
+            session.add_all(messages)
+
+async def save_messages_orm(conversation_id, rows):
+    """
+    Persist several messages of one conversation together.
+    `rows` are dicts with role, content and optionally name and tool_call_id.
+    """
+    messages = [Message(conversation_id=conversation_id, **row) for row in rows]
+    for message in messages:
+        _store_in_blob(message)
+    if message_writer.running:
+        _cache_append(conversation_id, messages)
+        await message_writer.write(messages)
+    else:
+        await insert_messages_orm(messages)
+        _cache_append(conversation_id, messages)
+
+async def save_message_orm(conversation_id, role, content, name=None, tool_call_id=None):
+    await save_messages_orm(conversation_id, [
+        {"role": role, "content": content, "name": name, "tool_call_id": tool_call_id}
+    ])
 
 async def get_conversation_messages_orm(conversation_id):
     async with AsyncSessionLocal() as session:
@@ -49,4 +341,176 @@ async def get_conversation_messages_orm(conversation_id):
             .filter(Message.conversation_id == conversation_id)
             .order_by(Message.id)
         )
-        return result.scalars().all()
+        return await expand_blobs(result.scalars().all(), copy=False, session=session)
+
+def estimate_tokens(text) -> int:
+    """Rough token count (~4 characters per token) plus per-message overhead."""
+    return len(text or "") // 4 + 4
+
+def message_tokens(message) -> int:
+    """estimate_tokens of a message, without loading its text when it is in a blob."""
+    return content_length(message) // 4 + 4
+
+def window_messages(rows, max_tokens=None):
+    """
+    Keep the newest rows that fit in `max_tokens`, then drop any assistant tool call
+    or tool result whose partner fell outside the window so the request stays valid.
+    """
+    if max_tokens:
+        total = 0
+        start = len(rows)
+        for i in range(len(rows) - 1, -1, -1):
+            total += message_tokens(rows[i])
+            if total > max_tokens:
+                break
+            start = i
+        rows = rows[start:]
+
+    call_ids = {m.tool_call_id for m in rows if m.role == "assistant" and m.tool_call_id}
+    result_ids = {m.tool_call_id for m in rows if m.role == "tool" and m.tool_call_id}
+    return [
+        m for m in rows
+        if not m.tool_call_id
+        or (m.role == "assistant" and m.tool_call_id in result_ids)
+        or (m.role == "tool" and m.tool_call_id in call_ids)
+    ]
+
+async def get_recent_messages_orm(conversation_id, limit=None, max_tokens=None, after_id=None):
+    """
+    Newest `limit` (at most HISTORY_MAX_MESSAGES) messages of a conversation, oldest first,
+    trimmed to `max_tokens`. `after_id` skips messages already folded into the conversation
+    summary. Served from the transcript cache when the conversation is hot.
+    """
+    limit = min(limit or config.HISTORY_MAX_MESSAGES, config.HISTORY_MAX_MESSAGES)
+    max_tokens = config.HISTORY_MAX_TOKENS if max_tokens is None else max_tokens
+
+    def window(rows):
+        if after_id:
+            rows = [m for m in rows if m.id is None or m.id > after_id]
+        return window_messages(rows[-limit:], max_tokens)
+
+    rows = transcript_cache.get(conversation_id)
+    if rows is None:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Message)
+                .filter(Message.conversation_id == conversation_id)
+                .order_by(Message.id.desc())
+                .limit(config.HISTORY_MAX_MESSAGES)
+            )
+            rows = list(result.scalars().all())
+            rows.reverse()
+            transcript_cache.set(conversation_id, rows)
+            # Only the blobs of messages inside the window are loaded, on the same connection
+            return await expand_blobs(window(rows), session=session)
+    return await expand_blobs(window(rows))
+
+async def get_messages_after_orm(conversation_id, after_id=None):
+    """All messages newer than `after_id`, oldest first."""
+    query = select(Message).filter(Message.conversation_id == conversation_id)
+    if after_id:
+        query = query.filter(Message.id > after_id)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(query.order_by(Message.id))
+        return await expand_blobs(result.scalars().all(), copy=False, session=session)
+
+def count_cached_messages_after(conversation_id, after_id=None) -> int | None:
+    """
+    Messages newer than `after_id` counted from the transcript cache, None when the cache
+    doesn't hold the conversation back to `after_id`.
+    """
+    rows = transcript_cache.peek(conversation_id)
+    if rows is None:
+        return None
+    newer = sum(1 for m in rows if m.id is None or not after_id or m.id > after_id)
+    # The cache has every newer message when it reaches back past after_id, or holds the whole chat
+    if newer < len(rows) or len(rows) < config.HISTORY_MAX_MESSAGES:
+        return newer
+    return None
+
+async def get_summary_orm(conversation_id):
+    """The conversation's summary row, None when it has none. Served from the summary cache when hot."""
+    summary = summary_cache.get(conversation_id)
+    if summary is None:
+        async with AsyncSessionLocal() as session:
+            summary = await session.get(ConversationSummary, conversation_id) or _NO_SUMMARY
+        summary_cache.set(conversation_id, summary)
+    return None if summary is _NO_SUMMARY else summary
+
+async def save_summary_orm(conversation_id, summary, last_message_id, summarized_tokens):
+    row = ConversationSummary(
+        conversation_id=conversation_id,
+        summary=summary,
+        last_message_id=last_message_id,
+        summarized_tokens=summarized_tokens,
+        updated_at=datetime.utcnow(),
+    )
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.merge(row)
+    summary_cache.set(conversation_id, row)
+
+async def add_image_job_orm(chat_id, model, payload):
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            job = ImageJob(chat_id=str(chat_id), model=model, payload=payload)
+            session.add(job)
+        return job
+
+async def claim_image_job_orm(worker_id):
+    """Mark the oldest due pending job as running by `worker_id` and return it, None when nothing is due."""
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            result = await session.execute(
+                select(ImageJob.id)
+                .filter(ImageJob.status == "pending", ImageJob.run_after <= datetime.utcnow())
+                .order_by(ImageJob.id)
+                .limit(5)
+            )
+            for job_id in result.scalars().all():
+                # Conditional update so two workers never claim the same job
+                claimed = await session.execute(
+                    update(ImageJob)
+                    .where(ImageJob.id == job_id, ImageJob.status == "pending")
+                    .values(status="running", attempts=ImageJob.attempts + 1, claimed_by=worker_id,
+                            claimed_at=datetime.utcnow())
+                )
+                if claimed.rowcount == 1:
+                    return await session.get(ImageJob, job_id)
+        return None
+
+async def update_image_job_orm(job_id, **values):
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            await session.execute(update(ImageJob).where(ImageJob.id == job_id).values(**values))
+
+async def release_image_jobs_orm(worker_id) -> int:
+    """Put the running jobs claimed by `worker_id` back in the queue, when that worker stops."""
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(ImageJob)
+                .where(ImageJob.status == "running", ImageJob.claimed_by == worker_id)
+                .values(status="pending", run_after=datetime.utcnow(), claimed_by=None, claimed_at=None)
+            )
+            return result.rowcount
+
+async def requeue_expired_image_jobs_orm(lease_seconds: float) -> int:
+    """
+    Put running jobs whose claim is older than `lease_seconds` back in the queue.
+
+    Their worker stopped without finishing them; jobs other replicas are still running
+    keep their claim.
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            result = await session.execute(
+                update(ImageJob)
+                .where(
+                    ImageJob.status == "running",
+                    or_(ImageJob.claimed_at.is_(None), ImageJob.claimed_at < now - timedelta(seconds=lease_seconds)),
+                )
+                .values(status="pending", run_after=now, claimed_by=None, claimed_at=None)
+            )
+            return result.rowcount
@@ -0,0 +1,38 @@
+from typing import Any, Dict, List
+from config import PROMPT_CACHE_HINTS
+
+# Loaded once, every request starts with exactly these bytes so providers can cache the prefix
+with open("prompt.md", "r", encoding="utf-8") as f:
+    SYSTEM_PROMPT = f.read()
+
+# Models OpenRouter only caches with explicit cache_control breakpoints, others cache prefixes on their own
+_CACHE_CONTROL_PREFIXES = ("anthropic/", "google/gemini")
+
+
+def uses_cache_control(model: str) -> bool:
+    return PROMPT_CACHE_HINTS and model.startswith(_CACHE_CONTROL_PREFIXES)
+
+
+def _cache_breakpoint(text: str) -> List[Dict[str, Any]]:
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def build_messages(model: str, summary: Dict[str, Any] | None, history: List[Dict[str, Any]],
+                   user_content: str) -> List[Dict[str, Any]]:
+    """
+    Messages for one turn, most stable first: system prompt, conversation summary, history,
+    then the new user message.
+
+    The system prompt (and the tools list sent before it, one fixed list per flow) doesn't
+    change, so it is cached across chats; the history only grows within a turn's tool loop, so the user message
+    is a second breakpoint that lets follow-up requests of the same turn reuse it.
+    """
+    hints = uses_cache_control(model)
+    messages: List[Dict[str, Any]] = [
+        {"role": "system", "content": _cache_breakpoint(SYSTEM_PROMPT) if hints else SYSTEM_PROMPT}
+    ]
+    if summary:
+        messages.append(summary)
+    messages.extend(history)
+    messages.append({"role": "user", "content": _cache_breakpoint(user_content) if hints else user_content})
+    return messages
@@ -0,0 +1,368 @@
+import re
+from typing import Any, Dict, List
+from tool_selector import UPLOAD_PREFIX, requested_flow
+
+# Fixed lines of the prompt.md flows, in English and Hinglish (no Devanagari), with a phrase
+# per language that recognizes the step in an assistant message, ours or a close rewording
+# by the LLM. Hinglish phrases must contain Hindi words, or English messages would match them.
+SCRIPT = {
+    "language": {
+        "en": "Please confirm your language before proceeding.",
+        "hi": "Please confirm your language before proceeding.",
+        "match": {"en": "confirm your language"},
+    },
+    "welcome": {
+        "en": (
+            "Hello! Welcome to Fridayy 👋\n"
+            "I'm your personal AI assistant, here to help you sell online — right from this chat.\n"
+            "Whether you want to set up a store, create a product catalog, manage inventory, or list on marketplaces?\n"
+            "I work with handmade brands, creators, and artisans like you to make online selling easy.\n"
+            "You can send me photos of your products, and I'll take care of the rest.\n"
+            "Shall we get started? First, please tell me your phone number?"
+        ),
+        "hi": (
+            "Namaste! Fridayy mein aapka swagat hai 👋\n"
+            "Main aapka personal AI assistant hoon, jo aapko isi chat se online bechne mein madad karega.\n"
+            "Chahe aapko store banana ho, product catalog banana ho, inventory manage karni ho, ya marketplaces par list karna ho?\n"
+            "Main aap jaise handmade brands, creators aur artisans ke saath kaam karta hoon taaki online selling aasaan ho.\n"
+            "Aap mujhe apne products ki photos bhejiye, baaki main sambhal lunga.\n"
+            "Shuru karein? Pehle, kripya apna phone number batayiye?"
+        ),
+        "match": {"en": "tell me your phone number", "hi": "apna phone number"},
+    },
+    "share_images": {
+        "en": (
+            "Please share the images of your product with me.\n"
+            "You can either click a photo using your camera or upload one from your gallery.\n"
+            "Make sure that there is only one product in each image, and no light is coming from behind the product.\n"
+            "The best option would be to place the product on a bed or against a white background before sharing."
+        ),
+        "hi": (
+            "Kripya apne product ki images share kijiye.\n"
+            "Aap camera se photo kheench sakte hain ya gallery se upload kar sakte hain.\n"
+            "Dhyan rakhein ki har image mein sirf ek product ho, aur product ke peeche se roshni na aa rahi ho.\n"
+            "Sabse accha hoga ki share karne se pehle product ko bed par ya white background ke saamne rakhein."
+        ),
+        "match": {"en": "share the images of your product", "hi": "product ki images"},
+    },
+    "upload_more": {
+        "en": "Thank you for uploading the image. Would you like to upload more?",
+        "hi": "Image upload karne ke liye dhanyavaad. Kya aap aur images upload karna chahenge?",
+        "match": {"en": "would you like to upload more", "hi": "aur images upload"},
+    },
+    "product_name": {
+        "en": "Thank you for uploading the image. Please tell me the name of the product.",
+        "hi": "Image upload karne ke liye dhanyavaad. Kripya product ka naam batayiye.",
+        "match": {"en": "name of the product", "hi": "product ka naam"},
+    },
+    "price": {
+        "en": "And what is the price of the product?",
+        "hi": "Aur is product ki price kya hai?",
+        "match": {"en": "price of the product", "hi": "product ki price"},
+    },
+    "material": {
+        "en": "Can you please tell me what material or fabric the product is made of?",
+        "hi": "Kripya batayiye ki yeh product kis material ya fabric se bana hai?",
+        "match": {"en": "material or fabric", "hi": "material ya fabric"},
+    },
+    "applications": {
+        "en": "And lastly, what are some use cases or applications of this product?",
+        "hi": "Aur aakhir mein, is product ke kuch use cases ya applications kya hain?",
+        "match": {"en": "use cases or applications", "hi": "use cases ya applications"},
+    },
+    "ai_image": {
+        "en": "Before we proceed, would you like an AI generated image of this product photo?",
+        "hi": "Aage badhne se pehle, kya aap is product photo ki AI generated image chahenge?",
+        "match": {"en": "would you like an ai generated image", "hi": "ai generated image chahenge"},
+    },
+    "confirm": {
+        "en": "Thank you. Before I proceed, can you confirm product details once more?\n{details}\nOnce confirmed, it will take 30-40s to generate!",
+        "hi": "Dhanyavaad. Aage badhne se pehle, kya aap product details ek baar confirm karenge?\n{details}\nConfirm karne ke baad, ise banne mein 30-40s lagenge!",
+        "match": {"en": "confirm product details", "hi": "product details ek baar confirm"},
+    },
+    "store_name": {
+        "en": "I will help you create a storefront. Before that, please tell me what you want to name your store.",
+        "hi": "Main aapka storefront banane mein madad karunga. Usse pehle, batayiye aap apne store ka naam kya rakhna chahte hain.",
+        "match": {"en": "what you want to name your store", "hi": "store ka naam"},
+    },
+    "store_details": {
+        "en": (
+            "Thank you! Please tell me the following details about your store:\n"
+            "1. Address of your store\n"
+            "2. WhatsApp number\n"
+            "3. Instagram ID (if you have one)"
+        ),
+        "hi": (
+            "Dhanyavaad! Kripya apne store ke baare mein yeh details batayiye:\n"
+            "1. Store ka address\n"
+            "2. WhatsApp number\n"
+            "3. Instagram ID (agar hai to)"
+        ),
+        "match": {"en": "following details about your store", "hi": "store ke baare mein yeh details"},
+    },
+    "story_offer": {
+        "en": (
+            "Thank you for sharing the details. Would you also like to showcase your personal and brand story on your storefront?\n"
+            "This helps people connect emotionally with your work."
+        ),
+        "hi": (
+            "Details share karne ke liye dhanyavaad. Kya aap apne storefront par apni personal aur brand story bhi dikhana chahenge?\n"
+            "Isse log aapke kaam se emotionally jud paate hain."
+        ),
+        "match": {"en": "showcase your personal and brand story", "hi": "brand story bhi dikhana"},
+    },
+    "story_photos": {
+        "en": (
+            "That's great! Please send 2-3 photos of yourself or your artisans working.\n"
+            "Make sure the photos are well lit and clear."
+        ),
+        "hi": (
+            "Bahut badhiya! Kripya apni ya apne artisans ki kaam karte hue 2-3 photos bhejiye.\n"
+            "Dhyan rakhein ki photos saaf aur achhi roshni mein hon."
+        ),
+        "match": {"en": "photos of yourself or your artisans", "hi": "artisans ki kaam karte"},
+    },
+    "story_prompt": {
+        "en": (
+            "Perfect. Now, could you tell us a little more about your process?\n"
+            "Here are some prompts to help you write your story:\n"
+            "1. What makes your process special — any handmade tools or traditional techniques?\n"
+            "2. How long does one item take to make?\n"
+            "3. What challenges do you face in your craft?"
+        ),
+        "hi": (
+            "Perfect. Ab, kya aap apne process ke baare mein thoda aur batayenge?\n"
+            "Apni story likhne ke liye kuch sawaal:\n"
+            "1. Aapke process ko kya khaas banata hai — koi handmade tools ya paramparik techniques?\n"
+            "2. Ek item banane mein kitna samay lagta hai?\n"
+            "3. Aapke craft mein kya challenges aate hain?"
+        ),
+        "match": {"en": "tell us a little more about your process", "hi": "process ke baare mein thoda"},
+    },
+}
+
+_CONFIRM_LABELS = {
+    "en": ("Name", "Price", "Material", "Applications", "AI image", "Images", "Yes", "No"),
+    "hi": ("Naam", "Price", "Material", "Applications", "AI image", "Images", "Haan", "Nahi"),
+}
+
+_YES = {"yes", "y", "yeah", "yep", "yes please", "ok", "okay", "sure", "haan", "han", "haa", "ha", "ji", "haan ji",
+        "ji haan", "theek hai", "thik hai", "done"}
+_NO = {"no", "n", "nope", "no thanks", "not now", "nahi", "nahin", "nhi", "na", "ji nahi", "nahi chahiye"}
+_HINGLISH_LANGUAGES = ("hindi", "hinglish", "marathi", "gujarati", "bengali", "bangla", "tamil", "telugu", "kannada",
+                       "malayalam", "punjabi", "odia", "urdu")
+
+_URL = re.compile(r"https?://\S+")
+# Longer answers are treated as free-form and left to the LLM
+_MAX_ANSWER_CHARS = 200
+
+
+# Flows each step belongs to, and the steps that start a flow
+_STEP_FLOWS = {
+    "language": {"onboarding"},
+    "welcome": {"onboarding"},
+    "share_images": {"product_upload"},
+    "upload_more": {"product_upload", "storefront"},
+    "product_name": {"product_upload"},
+    "price": {"product_upload"},
+    "material": {"product_upload"},
+    "applications": {"product_upload"},
+    "ai_image": {"product_upload"},
+    "confirm": {"product_upload"},
+    "store_name": {"storefront"},
+    "store_details": {"storefront"},
+    "story_offer": {"storefront"},
+    "story_photos": {"storefront"},
+    "story_prompt": {"storefront"},
+}
+_FLOW_START = {"language": "onboarding", "share_images": "product_upload", "store_name": "storefront"}
+# Tool calls inside a flow, after which its script carries on (Flow 3 asks for the story after capture_store_details)
+_FLOW_TOOLS = {"capture_store_details": "storefront", "upload_store_images": "storefront"}
+
+
+def _step(content) -> tuple[str | None, str]:
+    """The scripted step an assistant message asks for, and the language it is in."""
+    text = (content or "").lower()
+    for step, lines in SCRIPT.items():
+        for language, phrase in lines["match"].items():
+            if phrase in text:
+                return step, language
+    return None, "en"
+
+
+def _active_flow(history: List[Dict[str, Any]]) -> str | None:
+    """
+    The flow whose script the chat is following, None unless every assistant message back
+    to the start of that flow (or one of its tool calls) is a step of it.
+
+    Keeps a question of another flow that happens to read like a scripted one (Flow 4's
+    "new price of the product") away from the local path.
+    """
+    flows = None
+    for index in range(len(history) - 1, -1, -1):
+        msg = history[index]
+        if msg.get("role") != "assistant":
+            continue
+        if msg.get("tool_calls"):
+            names = {call["function"]["name"] for call in msg["tool_calls"]}
+            tool_flows = {_FLOW_TOOLS.get(name) for name in names}
+            if len(tool_flows) == 1 and flows and tool_flows <= flows:
+                return tool_flows.pop()
+            return None
+        step, _ = _step(msg.get("content"))
+        if step is None:
+            return None
+        flows = _STEP_FLOWS[step] if flows is None else flows & _STEP_FLOWS[step]
+        if not flows:
+            return None
+        flow = _FLOW_START.get(step)
+        if flow in flows:
+            if step == "share_images":
+                asked_by = next((m.get("content") or "" for m in reversed(history[:index]) if m.get("role") == "user"), "")
+                # Flow 6 asks for product photos the same way, then calls generate_ai_image
+                if "ai image" in asked_by.lower():
+                    return None
+            return flow
+    return None
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w\s]", "", text.lower()).strip()
+
+
+def _yes_no(text: str) -> bool | None:
+    answer = _normalize(text)
+    if answer in _YES:
+        return True
+    if answer in _NO:
+        return False
+    return None
+
+
+def _language(text: str) -> str | None:
+    answer = _normalize(text)
+    if "english" in answer or answer == "eng":
+        return "en"
+    if any(language in answer for language in _HINGLISH_LANGUAGES):
+        return "hi"
+    return None
+
+
+def _uploads(text: str) -> int:
+    return len(_URL.findall(text)) if text.startswith(UPLOAD_PREFIX) else 0
+
+
+def _answers(history: List[Dict[str, Any]]) -> Dict[str, str]:
+    """The seller's latest answer to each scripted step of `history`."""
+    answers = {}
+    for asked, answered in zip(history, history[1:]):
+        if asked.get("role") == "assistant" and answered.get("role") == "user":
+            step, _ = _step(asked.get("content"))
+            if step:
+                answers[step] = answered.get("content") or ""
+    return answers
+
+
+def _upload_context(history: List[Dict[str, Any]]) -> tuple[str | None, int]:
+    """The step that asked for the photos being uploaded, and how many have been uploaded since."""
+    images = 0
+    for index in range(len(history) - 1, -1, -1):
+        msg = history[index]
+        if msg.get("role") == "user":
+            images += _uploads(msg.get("content") or "")
+        elif msg.get("role") == "assistant":
+            step, _ = _step(msg.get("content"))
+            if step in ("share_images", "story_photos"):
+                asked_by = next((m.get("content") or "" for m in reversed(history[:index]) if m.get("role") == "user"), "")
+                # Flow 6 asks for product photos the same way, then calls generate_ai_image
+                return (None if "ai image" in asked_by.lower() else step), images
+    return None, images
+
+
+def _confirmation(history: List[Dict[str, Any]], wants_ai_image: bool, language: str) -> str | None:
+    answers = _answers(history)
+    if not all(step in answers for step in ("product_name", "price", "material", "applications")):
+        return None
+    name, price, material, applications, ai_image, images, yes, no = _CONFIRM_LABELS[language]
+    _, image_count = _upload_context(history)
+    details = "\n".join((
+        f"{name}: {answers['product_name']}",
+        f"{price}: {answers['price']}",
+        f"{material}: {answers['material']}",
+        f"{applications}: {answers['applications']}",
+        f"{ai_image}: {yes if wants_ai_image else no}",
+        f"{images}: {image_count}",
+    ))
+    return SCRIPT["confirm"][language].format(details=details)
+
+
+def scripted_reply(history: List[Dict[str, Any]], user_content: str,
+                   summarized: bool = False) -> tuple[str, str] | None:
+    """
+    The step name and local reply when this turn is a fixed step of a prompt.md flow, else None.
+
+    The step is read from the last assistant message and the reply is in that message's
+    language, only while the history shows the chat inside that step's flow. Anything that isn't a plain answer to it (a question, a long or unexpected
+    reply, a request for another flow) and every step that calls a tool is left to the LLM.
+    """
+    text = user_content.strip()
+    if not history:
+        if summarized:
+            return None
+        # Flow 1 starts by asking for the language, whatever the greeting
+        return ("language", SCRIPT["language"]["en"]) if len(text) <= _MAX_ANSWER_CHARS else None
+
+    last = history[-1]
+    if last.get("role") != "assistant" or last.get("tool_calls"):
+        return None
+    step, language = _step(last.get("content"))
+    if step is None or "?" in text or len(text) > _MAX_ANSWER_CHARS or requested_flow(text):
+        return None
+    if _active_flow(history) is None:
+        return None
+
+    def say(next_step: str) -> tuple[str, str]:
+        return next_step, SCRIPT[next_step][language]
+
+    uploads = _uploads(text)
+    if step == "language":
+        language = _language(text)
+        return ("welcome", SCRIPT["welcome"][language]) if language else None
+
+    if step in ("share_images", "story_photos", "upload_more"):
+        anchor, images = _upload_context(history)
+        if not uploads:
+            # "No" after product photos moves on to the details, store photos go to upload_store_images
+            if step == "upload_more" and anchor == "share_images" and _yes_no(text) is False and images:
+                return say("product_name")
+            return None
+        if anchor == "share_images" and images + uploads >= 2:
+            return say("product_name")
+        if anchor in ("share_images", "story_photos"):
+            return say("upload_more")
+        return None
+
+    if uploads:
+        return None
+    if step == "product_name":
+        return say("price")
+    if step == "price":
+        return say("material") if any(char.isdigit() for char in text) else None
+    if step == "material":
+        return say("applications")
+    if step == "applications":
+        return say("ai_image")
+    if step == "ai_image":
+        wants_ai_image = _yes_no(text)
+        if wants_ai_image is None:
+            return None
+        details = _confirmation(history, wants_ai_image, language)
+        return ("confirm", details) if details else None
+    if step == "store_name":
+        return say("store_details")
+    if step == "story_offer":
+        wants_story = _yes_no(text)
+        if wants_story is None:
+            return None
+        return say("story_photos" if wants_story else "story_prompt")
+    return None
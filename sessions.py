@@ -0,0 +1,150 @@
+import asyncio
+import base64
+import inspect
+import json
+import time
+from backend import watch_requests
+from cache import LRUCache
+from tools import SERIAL_TOOLS, auth_vendor
+from config import AUTH_SESSION_TTL, AUTH_REFRESH_MARGIN, AUTH_SESSION_MAX_ENTRIES
+
+# Names tools use for the bearer token argument
+TOKEN_ARGS = ("auth_token", "token")
+
+NOT_AUTHENTICATED = {"error": "Not authenticated. Call auth_vendor with the seller's phone number first."}
+
+
+def token_expiry(token: str) -> float | None:
+    """Unix time the JWT expires at, read from its `exp` claim without verifying it."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+def auth_failed(result) -> bool:
+    """Whether a tool result is the backend rejecting the token."""
+    if isinstance(result, dict):
+        return result.get("code") == "token_not_valid" or result.get("code") == "not_authenticated"
+    return isinstance(result, str) and result.startswith("Authentication failed")
+
+
+class AuthSession:
+    def __init__(self, phone_no: str, user_token: str, store_id, new_user):
+        self.phone_no = phone_no
+        self.user_token = user_token
+        self.store_id = store_id
+        self.new_user = new_user
+        self.expires_at = token_expiry(user_token) or time.time() + AUTH_SESSION_TTL
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at - AUTH_REFRESH_MARGIN > time.time()
+
+    def as_result(self) -> dict:
+        # Same shape auth_vendor returns, so the model sees no difference
+        return {"user_token": self.user_token, "store_id": self.store_id, "new_user": self.new_user}
+
+
+class SessionStore:
+    """
+    Vendor auth sessions, keyed by phone number and linked to the chats that logged in with it.
+
+    Tools called from a chat get its token (and store_id when the model left it out) filled in,
+    expired tokens are renewed before use, and a call the backend rejects with a 401 or
+    token_not_valid is retried once after logging in again. Side-effect tools (SERIAL_TOOLS)
+    are only retried when their first backend request was the one rejected, so nothing they
+    changed runs twice.
+    """
+
+    def __init__(self, max_entries: int):
+        self._by_phone = LRUCache(max_entries=max_entries)
+        self._phone_by_chat = LRUCache(max_entries=max_entries)
+        self._logins: dict[str, asyncio.Task] = {}  # phone -> auth request in flight
+        self.logins = 0
+        self.reused = 0
+        self.reauths = 0
+
+    def get(self, chat_id) -> AuthSession | None:
+        phone_no = self._phone_by_chat.peek(str(chat_id))
+        return self._by_phone.peek(phone_no) if phone_no else None
+
+    async def login(self, chat_id, phone_no: str, force: bool = False) -> dict:
+        """auth_vendor for a chat, answered from the stored session while its token is fresh."""
+        phone_no = str(phone_no)
+        self._phone_by_chat.set(str(chat_id), phone_no)
+        session = self._by_phone.get(phone_no)
+        if session is not None and session.fresh and not force:
+            self.reused += 1
+            return session.as_result()
+
+        # Concurrent logins for one phone share a single backend request
+        task = self._logins.get(phone_no)
+        if task is None:
+            task = asyncio.create_task(auth_vendor(phone_no))
+            self._logins[phone_no] = task
+            task.add_done_callback(lambda _: self._logins.pop(phone_no, None))
+            self.logins += 1
+        result = await asyncio.shield(task)
+        if result.get("user_token"):
+            self._by_phone.set(phone_no, AuthSession(phone_no, result["user_token"], result["store_id"], result["new_user"]))
+        return result
+
+    async def _current(self, chat_id) -> AuthSession | None:
+        session = self.get(chat_id)
+        if session is not None and not session.fresh:
+            await self.login(chat_id, session.phone_no, force=True)
+            session = self.get(chat_id)
+        return session
+
+    async def call(self, chat_id, fn, args: dict):
+        """Run a tool with the chat's session filled in, re-authenticating once if the token is rejected."""
+        params = inspect.signature(fn).parameters
+        token_arg = next((name for name in TOKEN_ARGS if name in params), None)
+        if token_arg is None:
+            return await fn(**args)
+
+        session = await self._current(chat_id)
+        if session is not None:
+            args[token_arg] = session.user_token
+            if "store_id" in params and args.get("store_id") in (None, "") and session.store_id:
+                args["store_id"] = session.store_id
+        elif not args.get(token_arg):
+            return NOT_AUTHENTICATED
+
+        with watch_requests() as requests:
+            try:
+                result = await fn(**args)
+            except Exception as e:
+                # A tool that raises on a 401 (AI image uploads) is retried like one returning it
+                if not any(status == 401 for _, status in requests):
+                    raise
+                result = e
+        rejected = any(status == 401 for _, status in requests)
+        if (rejected or auth_failed(result)) and session is not None:
+            print(f"Token rejected for chat {chat_id}, re-authenticating")
+            self.reauths += 1
+            renewed = await self.login(chat_id, session.phone_no, force=True)
+            repeatable = fn.__name__ not in SERIAL_TOOLS or (requests and requests[0][1] == 401)
+            if renewed.get("user_token") and repeatable:
+                args[token_arg] = renewed["user_token"]
+                result = await fn(**args)
+            elif renewed.get("user_token"):
+                print(f"Not repeating {fn.__name__} for chat {chat_id}, it may have changed data before the 401")
+        if isinstance(result, Exception):
+            raise result
+
+        if fn.__name__ == "create_store" and isinstance(result, dict) and result.get("store_id"):
+            session = self.get(chat_id)
+            if session is not None:
+                session.store_id = result["store_id"]
+        return result
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._by_phone), "logins": self.logins, "reused": self.reused, "reauths": self.reauths}
+
+
+session_store = SessionStore(AUTH_SESSION_MAX_ENTRIES)
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from telegram.error import BadRequest, RetryAfter
+from metrics import reply_first_visible_seconds
+
+
+class StreamingReply:
+    """
+    A Telegram message that shows the assistant's reply while it is being generated.
+
+    The message is sent once `min_chars` of cleaned text arrived and then edited at most every
+    `edit_interval` seconds, which keeps a chat well inside Telegram's edit rate limits.
+    Edits run in the background so the LLM stream is never held up by Telegram, and only
+    one is in flight at a time. finish() puts the final text in place. The same message
+    is reused across tool-call rounds of one turn.
+    """
+
+    def __init__(self, update, clean, min_chars: int, edit_interval: float):
+        self.update = update
+        self.clean = clean
+        self.min_chars = min_chars
+        self.edit_interval = edit_interval
+        self.message = None
+        self._started = time.monotonic()
+        self._shown = ""
+        self._latest = ""
+        self._last_edit = 0.0
+        self._pending: asyncio.Task | None = None
+
+    async def show(self, text: str):
+        self._latest = text
+        if self._pending and not self._pending.done():
+            return
+        now = time.monotonic()
+        # A RetryAfter, even on the first message, pushes _last_edit past now
+        if now < self._last_edit:
+            return
+        if self.message is not None and now - self._last_edit < self.edit_interval:
+            return
+        self._pending = asyncio.create_task(self._push())
+
+    async def _push(self):
+        text = self.clean(self._latest)
+        if text == self._shown or (self.message is None and len(text) < self.min_chars):
+            return
+        try:
+            if self.message is None:
+                self.message = await self.update.message.reply_text(text)
+                self._visible()
+            else:
+                await self.message.edit_text(text)
+            self._shown = text
+        except RetryAfter as e:
+            # Back off for as long as Telegram asks before the next edit
+            self._last_edit = time.monotonic() + e.retry_after
+            return
+        except BadRequest as e:
+            # "message is not modified" and similar are harmless for a progress edit
+            print(f"Streaming edit skipped: {e}")
+        self._last_edit = time.monotonic()
+
+    async def finish(self, text: str):
+        if self._pending:
+            await asyncio.gather(self._pending, return_exceptions=True)
+        backoff = self._last_edit - time.monotonic()
+        if backoff > 0:
+            await asyncio.sleep(backoff)
+        if self.message is None:
+            self.message = await self.update.message.reply_text(text)
+            self._visible()
+        elif text != self._shown:
+            await self.message.edit_text(text)
+        self._shown = text
+
+    def _visible(self):
+        reply_first_visible_seconds.observe(time.monotonic() - self._started)
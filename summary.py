@@ -0,0 +1,100 @@
+import asyncio
+import traceback
+from config import (
+    SUMMARY_ENABLED,
+    SUMMARY_TRIGGER_MESSAGES,
+    SUMMARY_KEEP_MESSAGES,
+    SUMMARY_MODEL,
+)
+from llm import chat_completion
+from models import (
+    count_cached_messages_after,
+    estimate_tokens,
+    get_messages_after_orm,
+    get_summary_orm,
+    save_summary_orm,
+)
+
+SUMMARY_INSTRUCTIONS = """You maintain the running memory of a Telegram chat between Fridayy bot and an Indian seller.
+Merge the previous summary with the new messages into one short summary written as plain notes.
+Always keep these exactly as they appear: language, phone_no, auth token, store_id, product ids, image URLs,
+storefront link, and any product or store details the seller has given that are not saved yet.
+Record which flow and step the conversation is at and what the bot asked last.
+Drop greetings, repeated questions and raw tool output that is no longer needed."""
+
+# Max characters of a single message included in the summarization request
+_MAX_MESSAGE_CHARS = 1500
+
+# Conversations with a summary update in flight, holds the task so it isn't garbage collected
+_pending: dict[str, asyncio.Task] = {}
+
+
+def summary_message(summary) -> dict:
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary.summary}"}
+
+
+def tokens_saved(summary) -> int:
+    """Estimated prompt tokens a request saves by sending the summary instead of the folded messages."""
+    return max(0, summary.summarized_tokens - estimate_tokens(summary.summary))
+
+
+def schedule_summary(conversation_id: str):
+    """Fold old turns into the summary in the background once the chat passes the threshold."""
+    if not SUMMARY_ENABLED or conversation_id in _pending:
+        return
+    task = asyncio.create_task(update_summary(conversation_id))
+    _pending[conversation_id] = task
+    task.add_done_callback(lambda _: _pending.pop(conversation_id, None))
+
+
+def _render(msg) -> str:
+    content = msg.content or ""
+    if len(content) > _MAX_MESSAGE_CHARS:
+        content = content[:_MAX_MESSAGE_CHARS] + "…"
+    if msg.role == "assistant" and msg.name and msg.tool_call_id:
+        return f"assistant called {msg.name}({content})"
+    if msg.role == "tool":
+        return f"tool {msg.name} returned: {content}"
+    return f"{msg.role}: {content}"
+
+
+async def update_summary(conversation_id: str):
+    try:
+        summary = await get_summary_orm(conversation_id)
+        after_id = summary.last_message_id if summary else None
+        # Most turns are below the threshold, tell from the cached transcript without a query
+        cached = count_cached_messages_after(conversation_id, after_id)
+        if cached is not None and cached <= SUMMARY_TRIGGER_MESSAGES:
+            return
+        rows = await get_messages_after_orm(conversation_id, after_id)
+        if len(rows) <= SUMMARY_TRIGGER_MESSAGES:
+            return
+
+        # Keep the newest messages verbatim, never splitting a tool call from its result
+        cut = len(rows) - SUMMARY_KEEP_MESSAGES
+        while cut > 0 and rows[cut].role == "tool":
+            cut -= 1
+        folded = rows[:cut]
+        if not folded:
+            return
+
+        previous = summary.summary if summary else "(none)"
+        transcript = "\n".join(_render(msg) for msg in folded)
+        response = await chat_completion(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": f"Previous summary:\n{previous}\n\nNew messages:\n{transcript}"},
+            ],
+        )
+        text = (response.choices[0].message.content or "").strip()
+        if not text:
+            return
+
+        summarized_tokens = (summary.summarized_tokens if summary else 0) + sum(
+            estimate_tokens(msg.content) for msg in folded
+        )
+        await save_summary_orm(conversation_id, text, folded[-1].id, summarized_tokens)
+        print(f"Summarized {len(folded)} messages for chat {conversation_id}")
+    except Exception as e:
+        print(f"Summary update failed for chat {conversation_id}: {e}\n{traceback.format_exc()}")
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import socket
+import sys
+
+import pytest
+
+# Settings are read at import time, so point the backend at the stub before any module loads
+_sock = socket.socket()
+_sock.bind(("127.0.0.1", 0))
+STUB_PORT = _sock.getsockname()[1]
+_sock.close()
+os.environ["FRIDAYY_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+# Engines connect lazily, no database is needed to import models
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://localhost/tests")
+os.environ.setdefault("OPENROUTER_API_KEY", "tests")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+
+class StubBackend:
+    """The Fridayy backend routes the cached tools use, counting the requests each one gets."""
+
+    def __init__(self):
+        self.calls: dict[str, int] = {}
+        self.token_rejected = False
+        self.image_latency = 0.0
+        self.uploads: list[list[tuple]] = []  # (field, filename, size, first byte) of each multipart part
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    async def products(self, request):
+        self._count("get_all_products")
+        if self.token_rejected:
+            return web.json_response({"detail": "Given token not valid", "code": "token_not_valid"}, status=401)
+        return web.json_response([{"id": 1, "product_name": "Blue saree", "store": request.query.get("store_id")}])
+
+    async def product(self, request):
+        self._count("get_product_by_id")
+        return web.json_response({"id": int(request.match_info["product_id"]), "product_name": "Blue saree"})
+
+    async def update_product(self, request):
+        self._count("update_product")
+        return web.json_response({"id": int(request.match_info["product_id"]), "mrp": 450})
+
+    async def storefront(self, request):
+        self._count("get_storefront_link")
+        return web.json_response({"is_storefront_exists": True, "store_link": "blue-saree-house"})
+
+    async def update_storefront(self, request):
+        self._count("update_storefront")
+        return web.json_response({"success": True})
+
+    async def store_profile(self, request):
+        self._count("generate_store_profile")
+        return web.json_response({"about": "Handloom sarees from Varanasi"})
+
+    async def image(self, request):
+        """A `size` byte image filled with byte `fill`, sent after `image_latency` seconds."""
+        self._count("image")
+        await asyncio.sleep(self.image_latency)
+        if request.match_info["fill"] == "missing":
+            return web.Response(status=404)
+        size = int(request.query.get("size", 1024))
+        return web.Response(body=bytes([int(request.match_info["fill"])]) * size, content_type="image/jpeg")
+
+    async def _multipart(self, request):
+        parts = []
+        reader = await request.multipart()
+        async for part in reader:
+            body = await part.read()
+            parts.append((part.name, part.filename, len(body), body[0] if part.filename and body else body.decode()))
+        self.uploads.append(parts)
+        return parts
+
+    async def upload_image(self, request):
+        self._count("upload_image")
+        await self._multipart(request)
+        return web.json_response({"product_id": 501, "message": "uploaded"})
+
+    async def generate_description(self, request):
+        self._count("generate_description")
+        return web.json_response({"short_description": "Handwoven cotton saree"})
+
+    async def about_images(self, request):
+        self._count("about_images")
+        await self._multipart(request)
+        return web.json_response({"success": True})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get("/ocr/get_all_products/", self.products)
+        app.router.add_get("/ocr/store/product/{product_id}", self.product)
+        app.router.add_put("/ocr/store/product/{product_id}/", self.update_product)
+        app.router.add_get("/apiv2/storefront/get_info/{store_id}/", self.storefront)
+        app.router.add_put("/apiv2/storefront/info/{store_id}/", self.update_storefront)
+        app.router.add_post("/bot/generate_store_profile/", self.store_profile)
+        app.router.add_get("/images/{fill}.jpg", self.image)
+        app.router.add_post("/bot/upload_image/", self.upload_image)
+        app.router.add_post("/bot/generate_description/", self.generate_description)
+        app.router.add_put("/apiv2/about_images/", self.about_images)
+        return app
+
+
+@pytest.fixture
+def run_with_stub():
+    """Run `scenario(stub)` on a fresh event loop with the stub backend up and an empty tool cache."""
+    import tool_cache
+    from backend import backend
+
+    def run(scenario):
+        async def main():
+            stub = StubBackend()
+            runner = web.AppRunner(stub.app())
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", STUB_PORT).start()
+            try:
+                return await scenario(stub)
+            finally:
+                await backend.close()
+                await runner.cleanup()
+
+        tool_cache._responses.clear()
+        tool_cache._responses.hits = tool_cache._responses.misses = 0
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import images
+import tools
+from conftest import STUB_PORT
+
+IMAGE_SIZE = 3 * 1024 * 1024
+
+
+def image_url(fill, size=IMAGE_SIZE):
+    return f"http://127.0.0.1:{STUB_PORT}/images/{fill}.jpg?size={size}"
+
+
+@pytest.fixture(params=[False, True], ids=["buffered", "streaming"])
+def streaming(request, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_UPLOAD_STREAMING", request.param)
+    return request.param
+
+
+def image_parts(upload):
+    return [(name, filename, size, fill) for name, filename, size, fill in upload if filename]
+
+
+def test_create_product_uploads_every_image_in_order(run_with_stub, streaming):
+    async def scenario(stub):
+        stub.image_latency = 0.2
+        started = time.perf_counter()
+        result = await tools.create_product(
+            None, [image_url(fill) for fill in (1, 2, 3, 4)], 7, "Blue saree", 450, "Festive wear", "Cotton", False, "tok",
+        )
+        return result, time.perf_counter() - started, stub.uploads
+
+    result, elapsed, uploads = run_with_stub(scenario)
+    assert result["upload_result"]["product_id"] == 501
+    assert uploads[0][0] == ("store_id", None, 1, "7")
+    assert image_parts(uploads[0]) == [("images", f"image_{i}.jpg", IMAGE_SIZE, i + 1) for i in range(4)]
+    if not streaming:
+        # Downloads run concurrently, not 4 x 0.2 s one after another
+        assert elapsed < 0.6
+
+
+def test_upload_store_images_uploads_every_image_in_order(run_with_stub, streaming):
+    async def scenario(stub):
+        stub.image_latency = 0.1
+        result = await tools.upload_store_images(7, [image_url(fill) for fill in (5, 6, 7)], "what_we_do", "tok")
+        return result, stub.uploads
+
+    result, uploads = run_with_stub(scenario)
+    assert result == {"success": True}
+    assert [part[0] for part in uploads[0][:2]] == ["store_id", "type"]
+    assert image_parts(uploads[0]) == [("file", f"image_{i}.jpg", IMAGE_SIZE, i + 5) for i in range(3)]
+
+
+def test_failed_download_returns_an_error(run_with_stub, streaming):
+    async def scenario(stub):
+        return await tools.create_product(
+            None, [image_url(1), image_url("missing")], 7, "Blue saree", 450, "Festive wear", "Cotton", False, "tok",
+        ), stub.uploads
+
+    result, uploads = run_with_stub(scenario)
+    assert isinstance(result, dict)
+    if streaming:
+        # A stream can't skip an image halfway through the body, the upload is abandoned
+        assert "error" in result
+    else:
+        assert result["upload_result"]["product_id"] == 501
+        assert image_parts(uploads[0]) == [("images", "image_0.jpg", IMAGE_SIZE, 1)]
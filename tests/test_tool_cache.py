@@ -0,0 +1,87 @@
+import tool_cache
+import tools
+
+
+def test_repeated_reads_hit_the_cache(run_with_stub):
+    async def scenario(stub):
+        for _ in range(3):
+            assert await tools.get_all_products(7, "tok") == [{"id": 1, "product_name": "Blue saree", "store": "7"}]
+        await tools.get_product_by_id(5, "tok")
+        await tools.get_product_by_id(5, "tok")
+        await tools.get_product_by_id(6, "tok")
+        return stub.calls
+
+    calls = run_with_stub(scenario)
+    assert calls == {"get_all_products": 1, "get_product_by_id": 2}
+    stats = tool_cache.cache_stats()
+    assert (stats["hits"], stats["misses"]) == (3, 3)
+
+
+def test_update_product_invalidates_the_product_and_lists(run_with_stub):
+    async def scenario(stub):
+        await tools.get_all_products(7, "tok")
+        await tools.get_product_by_id(5, "tok")
+        await tools.get_product_by_id(6, "tok")
+        await tools.update_product(5, "tok", mrp=450)
+        await tools.get_all_products(7, "tok")
+        await tools.get_product_by_id(5, "tok")
+        await tools.get_product_by_id(6, "tok")
+        return stub.calls
+
+    calls = run_with_stub(scenario)
+    # Product 6 is still cached, product 5 and the store's list are read again
+    assert calls["get_product_by_id"] == 3
+    assert calls["get_all_products"] == 2
+
+
+def test_storefront_writes_invalidate_the_storefront(run_with_stub):
+    async def scenario(stub):
+        seen = []
+        await tools.get_storefront_link(7, "tok")
+        await tools.get_storefront_link(7, "tok")
+        seen.append(stub.calls["get_storefront_link"])
+        await tools.capture_store_details(7, "Blue Saree House", "Varanasi", "9999999999", None, "tok")
+        await tools.get_storefront_link(7, "tok")
+        seen.append(stub.calls["get_storefront_link"])
+        await tools.update_storefront_info(7, {"store_name": "Blue Saree House"}, "tok")
+        await tools.get_storefront_link(7, "tok")
+        seen.append(stub.calls["get_storefront_link"])
+        await tools.capture_store_story(7, "Blue Saree House", {"process": "handloom"}, "tok")
+        calls_after_story = stub.calls["get_storefront_link"]
+        await tools.get_storefront_link(7, "tok")
+        seen.append(stub.calls["get_storefront_link"] - calls_after_story)
+        return seen
+
+    # capture_store_story reads the storefront itself, the next link is read once more
+    assert run_with_stub(scenario) == [1, 2, 3, 1]
+
+
+def test_entries_are_per_token_and_never_hold_it(run_with_stub):
+    async def scenario(stub):
+        await tools.get_all_products(7, "token-of-seller-a")
+        await tools.get_all_products(7, "token-of-seller-b")
+        await tools.get_all_products(7, "token-of-seller-a")
+        return stub.calls
+
+    calls = run_with_stub(scenario)
+    assert calls["get_all_products"] == 2
+    keys = list(tool_cache._responses._data)
+    assert {key[2] for key in keys} == {
+        tool_cache.token_fingerprint("token-of-seller-a"),
+        tool_cache.token_fingerprint("token-of-seller-b"),
+    }
+    assert not any("token-of-seller" in part for key in keys for part in key)
+
+
+def test_backend_errors_are_not_cached(run_with_stub):
+    async def scenario(stub):
+        stub.token_rejected = True
+        rejected = await tools.get_all_products(7, "tok")
+        stub.token_rejected = False
+        await tools.get_all_products(7, "tok")
+        await tools.get_all_products(7, "tok")
+        return rejected, stub.calls
+
+    rejected, calls = run_with_stub(scenario)
+    assert rejected["code"] == "token_not_valid"
+    assert calls["get_all_products"] == 2
@@ -0,0 +1,73 @@
+import functools
+import hashlib
+import inspect
+from cache import LRUCache
+from config import TOOL_CACHE_TTL, TOOL_CACHE_MAX_ENTRIES
+
+# (tool name, store_id or product_id, token fingerprint) -> backend response
+_responses = LRUCache(max_entries=TOOL_CACHE_MAX_ENTRIES, ttl=TOOL_CACHE_TTL)
+
+
+def token_fingerprint(token) -> str:
+    """Short hash of an auth token so cache keys never hold the token itself."""
+    return hashlib.sha256(str(token).encode()).hexdigest()[:16]
+
+
+def _cacheable(result) -> bool:
+    # Don't remember backend errors like {"detail": ...} or {"code": "token_not_valid"}
+    if isinstance(result, list):
+        return True
+    return isinstance(result, dict) and not ({"error", "detail", "code"} & result.keys())
+
+
+def cached_response(key_arg: str):
+    """Serve a read-only tool from the cache, keyed by the tool, its `key_arg` argument and the auth token."""
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if TOOL_CACHE_TTL <= 0:
+                return await fn(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs).arguments
+            key = (fn.__name__, str(arguments[key_arg]), token_fingerprint(arguments.get("auth_token")))
+            result = _responses.get(key)
+            if result is None:
+                result = await fn(*args, **kwargs)
+                if _cacheable(result):
+                    _responses.set(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def invalidates(*rules):
+    """
+    Drop cached responses a write tool may have changed, once it has run.
+
+    Each rule is (tool name, argument name): entries of that tool keyed by the argument's value are dropped.
+    With argument name None, all entries of that tool for the same auth token are dropped instead,
+    for writes that don't know the key (update_product doesn't know its store_id).
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                arguments = signature.bind(*args, **kwargs).arguments
+                fingerprint = token_fingerprint(arguments.get("auth_token"))
+                for tool_name, arg in rules:
+                    if arg is None:
+                        _responses.discard_where(lambda key: key[0] == tool_name and key[2] == fingerprint)
+                    else:
+                        value = str(arguments[arg])
+                        _responses.discard_where(lambda key: key[0] == tool_name and key[1] == value)
+        return wrapper
+    return decorator
+
+
+def cache_stats() -> dict:
+    return _responses.stats()
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+from config import TOOL_MAX_CONCURRENCY
+from tools import TOOL_MAPPING, SERIAL_TOOLS
+from sessions import session_store
+from tool_results import tool_results
+from metrics import tool_seconds, tool_calls_total, tool_errors_total
+
+# Tools that need the Telegram update to message the user directly
+UPDATE_TOOLS = {"generate_ai_image", "create_product"}
+
+
+async def execute_tool_call(update, tool_call) -> str:
+    """Run one tool call and return its JSON result, or a JSON error the model can read."""
+    tool_name = tool_call.function.name
+    label = tool_name if tool_name in TOOL_MAPPING or tool_name == "fetch_tool_result" else "unknown"
+    tool_calls_total.inc(tool=label)
+    started = time.perf_counter()
+    try:
+        tool_args = json.loads(tool_call.function.arguments)
+        print(f"Executing tool: {tool_name} with args: {tool_args}")
+        # Special handling for tools that need extra context
+        if tool_name in UPDATE_TOOLS:
+            tool_args["update"] = update
+        # Call the corresponding tool function with the chat's auth session
+        chat_id = update.effective_chat.id
+        if tool_name == "auth_vendor":
+            tool_result = await session_store.login(chat_id, **tool_args)
+        elif tool_name == "fetch_tool_result":
+            tool_result = tool_results.fetch(chat_id, **tool_args)
+        else:
+            tool_result = await session_store.call(chat_id, TOOL_MAPPING[tool_name], tool_args)
+        if isinstance(tool_result, dict) and "error" in tool_result:
+            tool_errors_total.inc(tool=label)
+        # Only the fields the flows need go to the model and the transcript
+        return json.dumps(tool_results.shape(chat_id, tool_name, tool_result))
+    except Exception as e:
+        # Gracefully handle tool failure
+        print(f"Tool call error for {tool_name}: {e}")
+        tool_errors_total.inc(tool=label)
+        return json.dumps({"error": f"Something went wrong while executing {tool_name}: {e}"})
+    finally:
+        tool_seconds.observe(time.perf_counter() - started, tool=label)
+
+
+async def run_tool_calls(update, tool_calls) -> list[str]:
+    """
+    Run the tool calls of one LLM turn and return their results in call order.
+
+    Consecutive read-only calls run concurrently (at most TOOL_MAX_CONCURRENCY at once).
+    Calls to SERIAL_TOOLS run alone, after everything requested before them, so side
+    effects happen in the order the model asked for.
+    """
+    results: list[str | None] = [None] * len(tool_calls)
+    semaphore = asyncio.Semaphore(TOOL_MAX_CONCURRENCY)
+
+    async def run(index):
+        async with semaphore:
+            results[index] = await execute_tool_call(update, tool_calls[index])
+
+    batch = []
+    for index, tool_call in enumerate(tool_calls):
+        if tool_call.function.name in SERIAL_TOOLS:
+            await asyncio.gather(*batch)
+            batch = []
+            await run(index)
+        else:
+            batch.append(run(index))
+    await asyncio.gather(*batch)
+    return results
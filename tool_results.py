@@ -0,0 +1,167 @@
+import hashlib
+import json
+from cache import LRUCache
+from config import (
+    TOOL_RESULT_SHAPING,
+    TOOL_RESULT_LIST_LIMIT,
+    TOOL_RESULT_STRING_LIMIT,
+    TOOL_RESULT_TTL,
+    TOOL_RESULT_MAX_BYTES,
+)
+
+# Fields the flows use from a product, the list only needs enough to pick one (Flow 4)
+PRODUCT_LIST_FIELDS = ("id", "product_id", "product_name", "name", "mrp", "price", "is_visible_in_storefront", "inventory")
+PRODUCT_FIELDS = PRODUCT_LIST_FIELDS + (
+    "short_description", "introduction", "key_features", "benefits_and_applications", "images", "ai_image_url",
+)
+STATUS_FIELDS = ("id", "success", "status", "message", "detail", "is_storefront_exists", "store_link")
+# Keys a backend list response may keep its items under
+_LIST_KEYS = ("products", "results", "data", "items")
+# Items per fetch_tool_result page, unprojected
+FETCH_PAGE_SIZE = 10
+# Smaller results are sent as they are
+_MIN_SHAPE_CHARS = 1000
+
+
+def _trim(value, depth: int = 0):
+    """Copy of `value` with long strings and lists cut, empty fields dropped and deep nesting summarized."""
+    if isinstance(value, str):
+        if len(value) > TOOL_RESULT_STRING_LIMIT:
+            return value[:TOOL_RESULT_STRING_LIMIT] + "…"
+        return value
+    if isinstance(value, dict):
+        if depth >= 3:
+            return f"<{len(value)} fields>"
+        return {key: _trim(item, depth + 1) for key, item in value.items() if item not in (None, "", [], {})}
+    if isinstance(value, list):
+        if depth >= 3:
+            return f"<{len(value)} items>"
+        return [_trim(item, depth + 1) for item in value[:TOOL_RESULT_LIST_LIMIT]]
+    return value
+
+
+def _project(item, fields):
+    if not isinstance(item, dict):
+        return _trim(item, 1)
+    return {key: _trim(item[key], 1) for key in fields if item.get(key) not in (None, "", [], {})}
+
+
+def _items(result):
+    """The list in a list response, bare or under one of _LIST_KEYS, and the key it's under."""
+    if isinstance(result, list):
+        return None, result
+    if isinstance(result, dict):
+        for key in _LIST_KEYS:
+            if isinstance(result.get(key), list):
+                return key, result[key]
+    return None, None
+
+
+def _shape_list(result, fields, noun: str):
+    key, items = _items(result)
+    if items is None:
+        return _trim(result)
+    shaped = {noun: [_project(item, fields) for item in items[:TOOL_RESULT_LIST_LIMIT]], "total": len(items)}
+    if key is not None:
+        shaped.update({name: _trim(value, 1) for name, value in result.items() if name != key and not isinstance(value, (list, dict))})
+    if len(items) > TOOL_RESULT_LIST_LIMIT:
+        shaped["note"] = (f"Showing {TOOL_RESULT_LIST_LIMIT} of {len(items)} {noun}, "
+                          "call fetch_tool_result with result_id and an offset for the rest.")
+    return shaped
+
+
+def _shape_product(result):
+    return _project(result, PRODUCT_FIELDS) if isinstance(result, dict) else _trim(result)
+
+
+def _shape_create_product(result):
+    return {
+        "upload_result": _project(result.get("upload_result"), ("product_id", "message", "image_urls")),
+        "description_result": _trim(result.get("description_result")),
+        **{key: value for key, value in result.items() if key not in ("upload_result", "description_result")},
+    }
+
+
+def _shape_store_story(result):
+    return {
+        "profile_response": _trim(result.get("profile_response")),
+        "update_result": _project(result.get("update_result"), STATUS_FIELDS),
+        "storefront_link": result.get("storefront_link"),
+    }
+
+
+def _shape_status(result):
+    return _project(result, STATUS_FIELDS) if isinstance(result, dict) else _trim(result)
+
+
+# Per-tool shapers, any other tool's result only gets the generic _trim
+SHAPERS = {
+    "get_all_products": lambda result: _shape_list(result, PRODUCT_LIST_FIELDS, "products"),
+    "get_product_by_id": _shape_product,
+    "update_product": _shape_product,
+    "create_product": _shape_create_product,
+    "capture_store_story": _shape_store_story,
+    "capture_store_details": _shape_status,
+    "upload_store_images": _shape_status,
+}
+
+
+class ToolResultStore:
+    """
+    Shapes tool results before they reach the model and the transcript.
+
+    Each tool keeps only the fields the flows use, lists are capped and long text cut. When
+    that drops anything, the full result is kept for a while under a `result_id` the model
+    can pass to fetch_tool_result to read it after all.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int):
+        # (chat id, result id) -> full result and its serialized size
+        self._full = LRUCache(max_entries=10_000, ttl=ttl, max_bytes=max_bytes, sizeof=lambda entry: entry[1])
+        self.shaped = 0
+        self.chars_saved = 0
+
+    def shape(self, chat_id, tool_name: str, result):
+        """The result to send to the model for `tool_name`, with a result_id when it was cut."""
+        # fetch_tool_result is how the model asks for the full data, it's never cut again
+        if not TOOL_RESULT_SHAPING or tool_name == "fetch_tool_result" or not isinstance(result, (dict, list)):
+            return result
+        if isinstance(result, dict) and "error" in result:
+            return result
+        full = json.dumps(result)
+        if len(full) < _MIN_SHAPE_CHARS:
+            return result
+        shaped = SHAPERS.get(tool_name, _trim)(result)
+        size = len(json.dumps(shaped))
+        if size >= len(full):
+            return result
+        result_id = hashlib.sha256(full.encode()).hexdigest()[:12]
+        self._full.set((str(chat_id), result_id), (result, len(full)))
+        self.shaped += 1
+        self.chars_saved += len(full) - size
+        if not isinstance(shaped, dict):
+            shaped = {"result": shaped}
+        return {**shaped, "result_id": result_id}
+
+    def fetch(self, chat_id, result_id: str, offset: int = 0):
+        """A page of the full result behind `result_id` (lists), or all of it."""
+        entry = self._full.get((str(chat_id), str(result_id)))
+        if entry is None:
+            return {"error": "That result is no longer available, call the original tool again."}
+        result, _ = entry
+        _, items = _items(result)
+        if items is None:
+            return result
+        offset = max(0, int(offset))
+        return {
+            "result_id": result_id,
+            "offset": offset,
+            "total": len(items),
+            "items": items[offset:offset + FETCH_PAGE_SIZE],
+        }
+
+    def stats(self) -> dict:
+        return {"shaped": self.shaped, "chars_saved": self.chars_saved, **self._full.stats()}
+
+
+tool_results = ToolResultStore(TOOL_RESULT_TTL, TOOL_RESULT_MAX_BYTES)
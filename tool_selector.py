@@ -0,0 +1,137 @@
+import json
+from typing import Any, Dict, List
+from tools_def import tools
+from models import estimate_tokens
+from config import TOOL_SUBSETS
+
+# Tools each flow of prompt.md needs. auth_vendor is always offered, so an expired
+# session can be re-authenticated from any step.
+FLOW_TOOLS = {
+    "onboarding": ("auth_vendor", "create_store"),
+    "product_upload": ("auth_vendor", "create_product", "generate_ai_image", "get_storefront_link"),
+    "storefront": (
+        "auth_vendor",
+        "get_storefront_link",
+        "capture_store_details",
+        "upload_store_images",
+        "capture_store_story",
+        "get_storefront_details",
+        "generate_store_edit_link",
+        "fetch_tool_result",
+    ),
+    "product_update": (
+        "auth_vendor",
+        "get_all_products",
+        "get_product_by_id",
+        "update_product",
+        "generate_product_edit_link",
+        "fetch_tool_result",
+    ),
+}
+
+# Flow the conversation is in after a tool call, create_store and create_product hand over
+# to the next step of the new user onboarding (product upload, then storefront)
+_FLOW_AFTER_TOOL = {
+    "create_store": "product_upload",
+    "create_product": "storefront",
+    "generate_ai_image": "product_upload",
+    "capture_store_details": "storefront",
+    "upload_store_images": "storefront",
+    "capture_store_story": "storefront",
+    "get_storefront_link": "storefront",
+    "get_storefront_details": "storefront",
+    "generate_store_edit_link": "storefront",
+    "get_all_products": "product_update",
+    "get_product_by_id": "product_update",
+    "update_product": "product_update",
+    "generate_product_edit_link": "product_update",
+}
+# fetch_tool_result stays in the flow of the call whose result it reads
+
+# Seller messages that start a flow, in English and Hinglish, checked in order
+_FLOW_KEYWORDS = (
+    ("product_update", ("update product", "edit product", "change product", "update a product", "product update",
+                        "price change", "change the price", "change price", "hide", "show product", "inventory",
+                        "out of stock", "product badal", "price badal")),
+    ("product_upload", ("add product", "add a product", "new product", "upload product", "upload a product",
+                        "create product", "ai image", "ai photo", "naya product", "product add", "product upload")),
+    ("storefront", ("storefront", "store link", "store page", "update store", "edit store", "dukaan")),
+)
+
+# Image uploads reach the model as a message starting with this (main.py)
+UPLOAD_PREFIX = "User uploaded the following image"
+# Longer seller messages, or questions, may start something new and get every tool
+_MAX_ANSWER_CHARS = 60
+
+_ALL_TOOLS_TOKENS = estimate_tokens(json.dumps(tools))
+
+# One list object per flow, in tools_def order, so a flow's requests share a cacheable prefix
+_SUBSETS = {
+    flow: [tool for tool in tools if tool["function"]["name"] in names] for flow, names in FLOW_TOOLS.items()
+}
+
+
+def _history_tools(history: List[Dict[str, Any]]) -> List[str]:
+    """Names of the tools called in `history`, oldest first."""
+    return [
+        call["function"]["name"]
+        for msg in history if msg.get("role") == "assistant"
+        for call in msg.get("tool_calls") or ()
+    ]
+
+
+def requested_flow(user_content: str) -> str | None:
+    """The flow the seller asks for by name in `user_content`, if any."""
+    text = user_content.lower()
+    for flow, keywords in _FLOW_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return flow
+    return None
+
+
+def _is_answer(user_content: str) -> bool:
+    """Whether `user_content` reads as a short answer to the bot's last question, or an image upload."""
+    text = user_content.strip()
+    return text.startswith(UPLOAD_PREFIX) or (len(text) <= _MAX_ANSWER_CHARS and "?" not in text)
+
+
+def detect_flow(history: List[Dict[str, Any]], user_content: str, summarized: bool = False) -> str | None:
+    """
+    The prompt.md flow a turn belongs to, or None when it can't be told.
+
+    A flow the seller asks for by name wins. Otherwise a short answer stays in the flow of
+    the last tool call, anything else may start another flow and gets None. A chat that
+    hasn't called any tool (and has no summary hiding older calls) is still in the initial
+    onboarding, which ends with auth_vendor.
+    """
+    flow = requested_flow(user_content)
+    if flow:
+        return flow
+    called = [name for name in _history_tools(history) if name != "fetch_tool_result"]
+    if called:
+        return _FLOW_AFTER_TOOL.get(called[-1]) if _is_answer(user_content) else None
+    return None if summarized else "onboarding"
+
+
+def select_tools(history: List[Dict[str, Any]], user_content: str,
+                 summarized: bool = False) -> tuple[str, List[Dict[str, Any]]]:
+    """
+    The flow name and tool definitions to send for this turn, "all" and every tool when unsure.
+
+    Tools already called in the history are always included, providers reject a history
+    that refers to tools the request doesn't define.
+    """
+    flow = detect_flow(history, user_content, summarized) if TOOL_SUBSETS else None
+    if flow is None:
+        return "all", tools
+    subset = _SUBSETS[flow]
+    missing = [name for name in dict.fromkeys(_history_tools(history)) if name not in FLOW_TOOLS[flow]]
+    if missing:
+        names = (*FLOW_TOOLS[flow], *missing)
+        subset = [tool for tool in tools if tool["function"]["name"] in names]
+    return flow, subset
+
+
+def tokens_saved(selected: List[Dict[str, Any]]) -> int:
+    """Estimated prompt tokens a request saves by sending `selected` instead of every tool."""
+    return max(0, _ALL_TOOLS_TOKENS - estimate_tokens(json.dumps(selected)))
@@ -1,45 +1,44 @@
 # tools.py
-import asyncio
-from io import BytesIO
 from urllib.parse import urlencode
 import aiohttp
-from openai import AsyncOpenAI
-import traceback
-from config import OPENROUTER_API_KEY
+from backend import get_session
+from images import ImageFetchError, image_parts, add_image_fields
+from tool_cache import cached_response, invalidates
+from image_queue import image_queue
+from config import FRIDAYY_BASE_URL
 
 
-client = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY,
-)
+base_url = FRIDAYY_BASE_URL
 
-base_url = "https://dev.fridayy.ai"
+# Cached read tools that show storefront data, dropped on any storefront write
+STOREFRONT_READS = (("get_storefront_details", "store_id"), ("get_storefront_link", "store_id"))
 
 # -------------------------
 # AUTH & STORE FUNCTIONS
 # -------------------------
 
 async def auth_vendor(phone_no):
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url + "/ocr/auth/vendor/", json={"phone_no": phone_no}) as response:
-            data = await response.json()
-            return {
-                "user_token": data.get("access_token"),
-                "store_id": data.get("store_id"),
-                "new_user": data.get("new_user")
-            }
+    session = get_session()
+    async with session.post(base_url + "/ocr/auth/vendor/", json={"phone_no": phone_no}) as response:
+        data = await response.json()
+        return {
+            "user_token": data.get("access_token"),
+            "store_id": data.get("store_id"),
+            "new_user": data.get("new_user")
+        }
 
 async def create_store(categories, token):
     headers = {"Authorization": f"Bearer {token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(base_url + "/ocr/create_store/", json={"categories": categories}, headers=headers) as response:
-            data = await response.json()
-            return {"store_id": data.get("id")}
+    session = get_session()
+    async with session.post(base_url + "/ocr/create_store/", json={"categories": categories}, headers=headers) as response:
+        data = await response.json()
+        return {"store_id": data.get("id")}
 
 # -------------------------
 # PRODUCT CREATION FLOW
 # -------------------------
 
+@invalidates(("get_all_products", "store_id"))
 async def create_product(
     update,
     image_urls,
@@ -53,248 +52,55 @@ async def create_product(
 ):
     headers = {"Authorization": f"Bearer {auth_token}"}
 
-    async with aiohttp.ClientSession() as session:
-        # ---------- Upload Product Images ----------
-        files = []
-        for i, url in enumerate(image_urls):
-            async with session.get(url) as response:
-                if response.status == 200:
-                    image_content = BytesIO(await response.read())
-                    files.append(('images', (f'image_{i}.jpg', image_content, 'image/jpeg')))
-                else:
-                    print(f"Failed to download image from {url}")
-
-        data = aiohttp.FormData()
-        data.add_field('store_id', str(store_id))
-        for field_name, file_tuple in files:
-            filename, file_obj, content_type = file_tuple
-            data.add_field(field_name, file_obj.getvalue(), filename=filename, content_type=content_type)
-
-        async with session.post(f"{base_url}/bot/upload_image/", data=data, headers=headers) as response:
-            upload_result = await response.json()
-
-        # Extract product_id from upload response
-        product_id = upload_result.get("product_id")
-        if not product_id:
-            return {"error": "Failed to get product_id from upload response", "upload_result": upload_result}
-        if ai_image:
-            # ---------- Generate AI Image ----------
-            ai_image_result = await generate_ai_image_helper(update, auth_token, product_id, store_id, product_name, image_urls[0])
-            if "Error" in ai_image_result or "failed" in ai_image_result.lower():
-                return {"error": ai_image_result, "upload_result": upload_result}
-            
-        # ---------- Generate Description ----------
-        payload = {
-            "product_id": product_id,
-            "product_name": product_name,
-            "mrp": MRP,
-            "application": application,
-            "material": material
-        }
-        async with session.post(f"{base_url}/bot/generate_description/", json=payload, headers=headers) as response:
-            description_result = await response.json()
+    session = get_session()
+    # ---------- Upload Product Images ----------
+    try:
+        async with image_parts(image_urls) as images:
+            data = aiohttp.FormData()
+            data.add_field('store_id', str(store_id))
+            add_image_fields(data, 'images', images)
+
+            async with session.post(f"{base_url}/bot/upload_image/", data=data, headers=headers) as response:
+                upload_result = await response.json()
+    except ImageFetchError as e:
+        return {"error": str(e)}
+
+    # Extract product_id from upload response
+    product_id = upload_result.get("product_id")
+    if not product_id:
+        return {"error": "Failed to get product_id from upload response", "upload_result": upload_result}
+    ai_image_job_id = None
+    if ai_image:
+        # ---------- Queue AI Image, sent to the user when it's ready ----------
+        ai_image_job_id = await image_queue.enqueue(
+            update.effective_chat.id, product_name, image_urls[0],
+            product_id=product_id, store_id=store_id, caption="✅ AI image generated successfully!",
+        )
+
+    # ---------- Generate Description ----------
+    payload = {
+        "product_id": product_id,
+        "product_name": product_name,
+        "mrp": MRP,
+        "application": application,
+        "material": material
+    }
+    async with session.post(f"{base_url}/bot/generate_description/", json=payload, headers=headers) as response:
+        description_result = await response.json()
 
-    return {
+    result = {
         "upload_result": upload_result,
         "description_result": description_result
     }
-
-async def generate_ai_image_old(update, image_url, auth_token):
-    headers = {"Authorization": f"Bearer {auth_token}"}
-    payload = {
-        "image_url": image_url,
-        "generation_type": "both",
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f"{base_url}/ocr/generate_ai_images/", json=payload, headers=headers) as response:
-            data = await response.json()
-
-    job_id = data.get("job_id")
-    if not job_id:
-        return data
-
-    # Schedule polling as background task (don't await here)
-    asyncio.create_task(poll_image_generation(update, job_id, headers))
-    return "Image generation started, user will be sent images when done."
-
-async def generate_ai_image_helper(update, auth_token, product_id, store_id, product_name, image_url):
-    try:
-        # Step 1: Call the API to generate the image
-        try:
-            completion = await client.chat.completions.create(
-                model="google/gemini-2.5-flash-image-preview",
-                modalities=["image", "text"],
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Product in the photo is {product_name}. Create a background for it showing it being used."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"{image_url}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            )
-        except Exception as e:
-            return f"Error during AI image generation API call: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 2: Extract Data URL
-        try:
-            data_url = completion.choices[0].message.images[0].get("image_url", {}).get("url")
-            if not data_url:
-                return "⚠️ AI image generation failed: No image returned."
-        except Exception as e:
-            return f"Error extracting Data URL: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 3: Convert Data URL to base64
-        try:
-            base64_str = data_url.split(",")[1]
-        except Exception as e:
-            return f"Error converting Data URL to Base64: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 4: Upload the AI image to your server
-        try:
-            headers = {"Authorization": f"Bearer {auth_token}"}
-            payload = {
-                "product_id": product_id,
-                "store_id": store_id,
-                "generation_type": "ai",
-                "base64_image": base64_str
-            }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{base_url}/bot/upload_ai_image/", json=payload, headers=headers) as response:
-                    try:
-                        data = await response.json()
-                    except Exception:
-                        return "Failed to upload AI image, ask user to retry"
-            if response.status == 401 or (
-                isinstance(data, dict)
-                and data.get("code") == "token_not_valid"
-            ):
-                return "Authentication failed. Please re-authenticate."
-            uploaded_image_url = data.get("ai_image_url")
-            if not uploaded_image_url:
-                return "No image URL returned from your server after upload."
-        except Exception as e:
-            return f"Error uploading AI image to server: {str(e)}\n{traceback.format_exc()}"
-
-        await update.message.reply_photo(photo=uploaded_image_url, caption="✅ AI image generated successfully!")
-        return "AI image generation completed and saved to product."
-
-    except Exception as e:
-        # Fallback for any unexpected errors
-        return f"Unexpected error: {str(e)}\n{traceback.format_exc()}"
+    if ai_image_job_id:
+        result["ai_image_job_id"] = ai_image_job_id
+    return result
 
 async def generate_ai_image(update, auth_token, product_name, image_url):
-    try:
-        # Step 1: Call the API to generate the image
-        try:
-            completion = await client.chat.completions.create(
-                model="google/gemini-2.5-flash-image-preview",
-                modalities=["image", "text"],
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Product in the photo is {product_name}. Create a background for it showing it being used."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"{image_url}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            )
-        except Exception as e:
-            return f"Error during AI image generation API call: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 2: Extract Data URL
-        try:
-            data_url = completion.choices[0].message.images[0].get("image_url", {}).get("url")
-            if not data_url:
-                return "⚠️ AI image generation failed: No image returned."
-        except Exception as e:
-            return f"Error extracting Data URL: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 3: Convert Data URL to base64
-        try:
-            base64_str = data_url.split(",")[1]
-        except Exception as e:
-            return f"Error converting Data URL to Base64: {str(e)}\n{traceback.format_exc()}"
-
-        # Step 4: Upload the AI image to your server
-        try:
-            headers = {"Authorization": f"Bearer {auth_token}"}
-            payload = {
-                "base64_image": base64_str
-            }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{base_url}/bot/upload_image_to_s3/", json=payload, headers=headers) as response:
-                    try:
-                        data = await response.json()
-                    except Exception:
-                        return "Failed to upload AI image, ask user to retry"
-            if response.status == 401 or (
-                isinstance(data, dict)
-                and data.get("code") == "token_not_valid"
-            ):
-                return "Authentication failed. Please re-authenticate."
-            uploaded_image_url = data.get("image_url")
-            if not uploaded_image_url:
-                return "No image URL returned from your server after upload."
-        except Exception as e:
-            return f"Error uploading AI image to server: {str(e)}\n{traceback.format_exc()}"
-
-        await update.message.reply_photo(photo=uploaded_image_url)
-        return "AI image generation completed and sent to user."
-
-    except Exception as e:
-        # Fallback for any unexpected errors
-        return f"Unexpected error: {str(e)}\n{traceback.format_exc()}"
-
-async def poll_image_generation(update, job_id, headers):
-    # Step 2: Poll Every 30 Seconds Until Done
-    tries = 40
-    async with aiohttp.ClientSession() as session:
-        while tries > 0:
-            tries -= 1
-            async with session.get(f"{base_url}/ocr/check_status/{job_id}/", headers=headers) as response:
-                print(f"Polling for job {job_id}, tries left: {tries}")
-                if response.status == 200:
-                    data = await response.json()
-                    status = data.get("status")
-                    result_image_urls = data.get("result_image_url", [])
-                    error = data.get("error_message")
-                    if status == "completed" and isinstance(result_image_urls, list):
-                        # Send all available images
-                        for image in result_image_urls:
-                            image_type = image.get("type")
-                            image_url = image.get("value")
-                            if image_url and image_type:
-                                caption = f"✅ {image_type.capitalize()} image generated!"
-                                #process_llm(update, f"User has been sent the image: {image_type.capitalize()} ")
-                                await update.message.reply_photo(photo=image_url, caption=caption)
-                        break
-
-                    elif error:
-                        await update.message.reply_text(f"❌ AI image generation failed:\n{error}")
-                        break
-
-            await asyncio.sleep(30)
+    job_id = await image_queue.enqueue(update.effective_chat.id, product_name, image_url)
+    return f"AI image generation queued as job {job_id}, the user will be sent the image when it's done."
 
+@invalidates(*STOREFRONT_READS)
 async def capture_store_details(store_id, store_name, address, whatsapp_number, instagram_id, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     payload = {
@@ -304,34 +110,28 @@ async def capture_store_details(store_id, store_name, address, whatsapp_number,
     }
     if instagram_id:
         payload["instagram_id"] = instagram_id
-    async with aiohttp.ClientSession() as session:
-        async with session.put(f"{base_url}/apiv2/storefront/info/{store_id}/", json=payload, headers=headers) as response:
-            return await response.json()
+    session = get_session()
+    async with session.put(f"{base_url}/apiv2/storefront/info/{store_id}/", json=payload, headers=headers) as response:
+        return await response.json()
 
+@invalidates(*STOREFRONT_READS)
 async def upload_store_images(store_id, image_urls, image_type, auth_token):
-    files = []
     headers = {"Authorization": f"Bearer {auth_token}"}
 
-    async with aiohttp.ClientSession() as session:
-        for i, url in enumerate(image_urls):
-            async with session.get(url) as response:
-                if response.status == 200:
-                    image_content = BytesIO(await response.read())
-                    files.append(('file', (f'image_{i}.jpg', image_content, 'image/jpeg')))
-                else:
-                    print(f"Failed to download image from {url}")
-
-        data = aiohttp.FormData()
-        data.add_field('store_id', str(store_id))
-        data.add_field('type', image_type)
-        
-        for field_name, file_tuple in files:
-            filename, file_obj, content_type = file_tuple
-            data.add_field(field_name, file_obj.getvalue(), filename=filename, content_type=content_type)
-
-        async with session.put(f"{base_url}/apiv2/about_images/", data=data, headers=headers) as response:
-            return await response.json()
-
+    session = get_session()
+    try:
+        async with image_parts(image_urls) as images:
+            data = aiohttp.FormData()
+            data.add_field('store_id', str(store_id))
+            data.add_field('type', image_type)
+            add_image_fields(data, 'file', images)
+
+            async with session.put(f"{base_url}/apiv2/about_images/", data=data, headers=headers) as response:
+                return await response.json()
+    except ImageFetchError as e:
+        return {"error": str(e)}
+
+@invalidates(*STOREFRONT_READS)
 async def capture_store_story(store_id, store_name, stories: dict, auth_token: str):
     headers = {"Authorization": f"Bearer {auth_token}"}
     payload = {
@@ -340,86 +140,91 @@ async def capture_store_story(store_id, store_name, stories: dict, auth_token: s
         "details": stories
     }
 
-    async with aiohttp.ClientSession() as session:
-        # First API call: generate store profile
-        async with session.post(
-            f"{base_url}/bot/generate_store_profile/",
-            json=payload,
-            headers=headers
-        ) as response:
-            profile_response = await response.json()
-        # Second API call: update storefront info
-        update_payload = {"is_storefront_exists": True}
-        async with session.put(
-            f"{base_url}/apiv2/storefront/info/{store_id}/",
-            json=update_payload,
-            headers=headers
-        ) as update_response:
-            update_result = await update_response.json()
-        async with session.get(
-            f"{base_url}/apiv2/storefront/get_info/{store_id}/",
-            headers=headers
-        ) as response:
-            data = await response.json()
-            storefront_link = f'development.fridayy.ai/{data.get("store_link")}/'
+    session = get_session()
+    # First API call: generate store profile
+    async with session.post(
+        f"{base_url}/bot/generate_store_profile/",
+        json=payload,
+        headers=headers
+    ) as response:
+        profile_response = await response.json()
+    # Second API call: update storefront info
+    update_payload = {"is_storefront_exists": True}
+    async with session.put(
+        f"{base_url}/apiv2/storefront/info/{store_id}/",
+        json=update_payload,
+        headers=headers
+    ) as update_response:
+        update_result = await update_response.json()
+    async with session.get(
+        f"{base_url}/apiv2/storefront/get_info/{store_id}/",
+        headers=headers
+    ) as response:
+        data = await response.json()
+        storefront_link = f'development.fridayy.ai/{data.get("store_link")}/'
     return {"profile_response": profile_response, "update_result": update_result, "storefront_link": storefront_link}
 
+@cached_response("store_id")
 async def get_storefront_link(store_id, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{base_url}/apiv2/storefront/get_info/{store_id}/",
-            headers=headers
-        ) as response:
-            data = await response.json()
-
-            if data.get("is_storefront_exists"):
-                storefront_link = f'development.fridayy.ai/{data.get("store_link")}/'
-                return {"storefront_link": storefront_link}
-            else:
-                return {"storefront_link": None, "message": "Storefront does not exist yet, ask the user to set it up with reference flow."}
+    session = get_session()
+    async with session.get(
+        f"{base_url}/apiv2/storefront/get_info/{store_id}/",
+        headers=headers
+    ) as response:
+        data = await response.json()
+
+        if data.get("is_storefront_exists"):
+            storefront_link = f'development.fridayy.ai/{data.get("store_link")}/'
+            return {"storefront_link": storefront_link}
+        else:
+            return {"storefront_link": None, "message": "Storefront does not exist yet, ask the user to set it up with reference flow."}
 
 # -------------------------
 # NEW: PRODUCT & STOREFRONT MANAGEMENT
 # -------------------------
 
+@cached_response("store_id")
 async def get_all_products(store_id, auth_token):
     """
     GET /ocr/get_all_products/?store_id={store_id}
     """
     headers = {"Authorization": f"Bearer {auth_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{base_url}/ocr/get_all_products/",
-            params={"store_id": str(store_id)},
-            headers=headers
-        ) as response:
-            return await response.json()
-
+    session = get_session()
+    async with session.get(
+        f"{base_url}/ocr/get_all_products/",
+        params={"store_id": str(store_id)},
+        headers=headers
+    ) as response:
+        return await response.json()
+
+@cached_response("product_id")
 async def get_product_by_id(product_id, auth_token):
     """
     GET /ocr/store/product/{product_id}
     """
     headers = {"Authorization": f"Bearer {auth_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{base_url}/ocr/store/product/{product_id}",
-            headers=headers
-        ) as response:
-            return await response.json()
-
+    session = get_session()
+    async with session.get(
+        f"{base_url}/ocr/store/product/{product_id}",
+        headers=headers
+    ) as response:
+        return await response.json()
+
+@cached_response("store_id")
 async def get_storefront_details(store_id, auth_token):
     """
     GET /ocr/storefront/get_info/{store_id}
     """
     headers = {"Authorization": f"Bearer {auth_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            f"{base_url}/ocr/storefront/get_info/{store_id}",
-            headers=headers
-        ) as response:
-            return await response.json()
+    session = get_session()
+    async with session.get(
+        f"{base_url}/ocr/storefront/get_info/{store_id}",
+        headers=headers
+    ) as response:
+        return await response.json()
         
+@invalidates(("get_product_by_id", "product_id"), ("get_all_products", None))
 async def update_product(
     product_id: int,
     auth_token: str,
@@ -458,14 +263,15 @@ async def update_product(
     if inventory is not None:
         payload["inventory"] = inventory
 
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            f"{base_url}/ocr/store/product/{product_id}/",
-            json=payload,
-            headers=headers
-        ) as response:
-            return await response.json()
+    session = get_session()
+    async with session.put(
+        f"{base_url}/ocr/store/product/{product_id}/",
+        json=payload,
+        headers=headers
+    ) as response:
+        return await response.json()
 
+@invalidates(*STOREFRONT_READS)
 async def update_storefront_info(store_id, storefront_payload, auth_token):
     """
     PUT /apiv2/storefront/info/{store_id}/
@@ -473,13 +279,13 @@ async def update_storefront_info(store_id, storefront_payload, auth_token):
           instagram_id, description, email, about_store, what_we_do, etc.)
     """
     headers = {"Authorization": f"Bearer {auth_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.put(
-            f"{base_url}/apiv2/storefront/info/{store_id}/",
-            json=storefront_payload,
-            headers=headers
-        ) as response:
-            return await response.json()
+    session = get_session()
+    async with session.put(
+        f"{base_url}/apiv2/storefront/info/{store_id}/",
+        json=storefront_payload,
+        headers=headers
+    ) as response:
+        return await response.json()
 
 async def generate_product_edit_link(phone: str, product_id: int) -> str:
     """
@@ -528,4 +334,15 @@ TOOL_MAPPING = {
     "update_product": update_product,
     "generate_product_edit_link": generate_product_edit_link,
     "generate_store_edit_link": generate_store_edit_link,
-}
\ No newline at end of file
+}
+# Tools with side effects, run one at a time in the order the model requested them
+SERIAL_TOOLS = {
+    "auth_vendor",
+    "create_store",
+    "create_product",
+    "generate_ai_image",
+    "capture_store_details",
+    "upload_store_images",
+    "capture_store_story",
+    "update_product",
+}
@@ -39,7 +39,7 @@ tools = [
                     },
                     "token": {"type": "string"}
                 },
-                "required": ["categories", "token"]
+                "required": ["categories"]
             }
         }
     },
@@ -86,7 +86,7 @@ tools = [
                 "description": "Bearer token for authentication"
                 }
             },
-            "required": ["image_urls", "store_id", "product_name", "MRP", "application", "material", "ai_image", "auth_token"]
+            "required": ["image_urls", "product_name", "MRP", "application", "material", "ai_image"]
             }
         }
     },
@@ -111,7 +111,7 @@ tools = [
                         "description": "Name of the product"
                     }
                 },
-                "required": ["image_url", "product_name", "auth_token"]
+                "required": ["image_url", "product_name"]
             }
         }
     },
@@ -119,7 +119,7 @@ tools = [
         "type": "function",
         "function": {
             "name": "capture_store_details",
-            "description": "Capture store name, address, WhatsApp number, and Instagram ID. Requires store_id and auth_token.",
+            "description": "Capture store name, address, WhatsApp number, and Instagram ID. Uses the authenticated store unless store_id is given.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -130,7 +130,7 @@ tools = [
                     "instagram_id": { "type": "string" },
                     "auth_token": { "type": "string" }
                 },
-                "required": ["store_name", "store_id", "address", "whatsapp_number", "instagram_id", "auth_token"]
+                "required": ["store_name", "address", "whatsapp_number", "instagram_id"]
             }
         }
     },
@@ -138,7 +138,7 @@ tools = [
         "type": "function",
         "function": {
             "name": "upload_store_images",
-            "description": "Upload workspace/process images. Requires image URLs, store_id, and auth_token.",
+            "description": "Upload workspace/process images. Requires image URLs.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -153,7 +153,7 @@ tools = [
                     },
                     "auth_token": { "type": "string" }
                 },
-                "required": ["store_id", "image_urls", "image_type" "auth_token"]
+                "required": ["image_urls", "image_type"]
             }
         }
     },
@@ -161,7 +161,7 @@ tools = [
         "type": "function",
         "function": {
             "name": "capture_store_story",
-            "description": "Capture the user’s story details about their process and challenges. Requires store_id, stories (a dict of 3 story types), and auth_token.",
+            "description": "Capture the user’s story details about their process and challenges. Requires stories (a dict of 3 story types).",
             "parameters": {
             "type": "object",
             "properties": {
@@ -179,7 +179,7 @@ tools = [
                 },
                 "auth_token": { "type": "string" }
             },
-            "required": ["store_id", "store_name", "stories", "auth_token"]
+            "required": ["store_name", "stories"]
             }
         }
     },
@@ -194,7 +194,7 @@ tools = [
                     "store_id": { "type": "string" },
                     "auth_token": { "type": "string" }
                 },
-                "required": ["store_id", "auth_token"]
+                "required": []
             }
         }
     },
@@ -209,7 +209,7 @@ tools = [
                     "store_id": { "type": "string", "description": "Store ID" },
                     "auth_token": { "type": "string", "description": "Bearer token" }
                 },
-                "required": ["store_id", "auth_token"]
+                "required": []
             }
         }
     },
@@ -264,7 +264,7 @@ tools = [
                 "description": "Available inventory quantity"
                 }
             },
-            "required": ["product_id", "auth_token"]
+            "required": ["product_id"]
             }
         }
     },
@@ -279,7 +279,7 @@ tools = [
                     "store_id": { "type": "string", "description": "Store ID" },
                     "auth_token": { "type": "string", "description": "Bearer token" }
                 },
-                "required": ["store_id", "auth_token"]
+                "required": []
             }
         }
     },
@@ -294,7 +294,7 @@ tools = [
                     "product_id": { "type": "string", "description": "Product ID to update" },
                     "auth_token": { "type": "string", "description": "Bearer token" }
                 },
-                "required": ["product_id", "auth_token"]
+                "required": ["product_id"]
             }
         }
     },
@@ -336,4 +336,19 @@ tools = [
         }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "fetch_tool_result",
+            "description": "Read the full data behind a shortened tool result, using the result_id it returned. Lists come in pages of 10 from offset.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "result_id": { "type": "string", "description": "result_id from the shortened tool result" },
+                    "offset": { "type": "integer", "description": "First list item to return, default 0" }
+                },
+                "required": ["result_id"]
+            }
+        }
+    },
 ]
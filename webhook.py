@@ -0,0 +1,67 @@
+import asyncio
+import hmac
+import json
+import traceback
+from aiohttp import web
+from telegram import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookIngress:
+    """
+    Receives Telegram webhook updates on the health aiohttp app.
+
+    The HTTP handler only checks the secret token and puts the update on a bounded
+    queue, so it answers right away. When the queue is full it answers 503 and
+    Telegram redelivers the update later. `workers` tasks feed queued updates to
+    the bot's handlers.
+    """
+
+    def __init__(self, application, secret: str | None, queue_size: int, workers: int):
+        self.application = application
+        self.secret = secret
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not self.secret or not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return web.Response(status=503)
+        self.received += 1
+        return web.Response(text="OK")
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def _work(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.de_json(data, self.application.bot)
+                await self.application.process_update(update)
+            except Exception as e:
+                print(f"Error processing webhook update: {e}\n{traceback.format_exc()}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self, timeout: float = 10):
+        """Finish the queued updates (up to `timeout` seconds), then stop the workers."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Dropping {self.queue.qsize()} queued webhook updates on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)